@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+
+"""An asyncio runner for ControlModel.
+
+control.main does everything in one loop: read the joystick, solve, send, wait for the next
+frame. Here each of those is its own task, connected by channels that only keep the latest
+value, so a slow IK solve drops intermediate stick positions instead of delaying input
+sampling or telemetry:
+
+* input: samples the joystick at a fixed rate.
+* telemetry: measures how often positions arrive from the brick. The ControlModel reads the
+  latest position from client itself, so this stage only measures and passes nothing on.
+* ik: feeds the latest stick input to the ControlModel in a worker thread.
+* transmit: sends the latest target produced by the ControlModel.
+
+The runner prints the achieved rate and latency of each stage every few seconds. For the
+telemetry stage, the latency is the age of each position when it is taken in.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Generic, Sequence, TypeVar, cast
+import numpy as np
+import pygame
+
+import client
+import control
+import frame_timing
+from control import ControlMode, ControlModel
+
+T = TypeVar("T")
+
+_INPUT_HZ = 60
+_REPORT_INTERVAL_S = 5.0
+
+INPUT = 0
+TELEMETRY = 1
+IK = 2
+TRANSMIT = 3
+STAGE_NAMES = ("input", "telemetry", "ik", "transmit")
+
+
+class LatestValue(Generic[T]):
+    """A channel that holds only the most recent value published to it."""
+
+    def __init__(self):
+        self._value: T | None = None
+        self._seq = 0
+        self._event = asyncio.Event()
+
+    def publish(self, value: T):
+        self._value = value
+        self._seq += 1
+        self._event.set()
+
+    async def get_newer(self, seq: int) -> tuple[T, int]:
+        """Waits for a value newer than seq. Returns the value and its sequence number."""
+        while self._seq <= seq:
+            self._event.clear()
+            await self._event.wait()
+        return cast(T, self._value), self._seq
+
+
+class AsyncRunner:
+    def __init__(self, controller: ControlModel, input_hz: float = _INPUT_HZ):
+        self._controller = controller
+        self._input_period = 1 / input_hz
+        self._sticks: LatestValue[np.ndarray] = LatestValue()
+        self._targets: LatestValue[tuple[int, int, int, int]] = LatestValue()
+        self.timings = frame_timing.FrameTimings(stage_names=STAGE_NAMES)
+        # The ControlModel isn't thread safe, so all calls into it go through a single thread.
+        self._ik_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ik")
+        # Buttons pressed since the ik stage last took them. Pressed buttons must not be dropped
+        # like stale stick positions, so they are queued here rather than sent with the stick.
+        self._pending_buttons: list[int] = []
+
+    def _sample(self):
+        # Read the stick before pumping events, which moves the joystick on to the next input.
+        if pygame.joystick.get_count() > 0:
+            self._sticks.publish(control.get_arm_direction(pygame.joystick.Joystick(0)))
+        self._pending_buttons.extend(
+            cast(int, event.button) for event in pygame.event.get() if event.type == pygame.JOYBUTTONDOWN
+        )
+
+    async def _input(self):
+        next_sample = time.monotonic()
+        while True:
+            start = time.perf_counter_ns()
+            self._sample()
+            self.timings.record(INPUT, start)
+
+            next_sample += self._input_period
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                # We fell behind, don't try to catch up with a burst of samples.
+                next_sample = time.monotonic()
+            await asyncio.sleep(max(0.0, delay))
+
+    async def _telemetry(self):
+        loop = asyncio.get_running_loop()
+        seq = 0
+        while True:
+            position = await loop.run_in_executor(None, client.wait_newer_than, seq, 1.0)
+            if position is None:
+                continue
+            seq = position.seq
+            age = time.monotonic() - position.timestamp
+            self.timings.record_elapsed(TELEMETRY, max(0, int(age * 1e9)))
+
+    def _handle_input(self, v: np.ndarray, buttons: Sequence[int]):
+        self._controller.handle_stick_input(v)
+        self._controller.handle_button_press(buttons)
+
+    async def _ik(self):
+        loop = asyncio.get_running_loop()
+        seq = 0
+        while True:
+            v, seq = await self._sticks.get_newer(seq)
+            buttons, self._pending_buttons = self._pending_buttons, []
+            start = time.perf_counter_ns()
+            await loop.run_in_executor(self._ik_executor, self._handle_input, v, buttons)
+            self.timings.record(IK, start)
+
+    async def _transmit(self):
+        seq = 0
+        while True:
+            target, seq = await self._targets.get_newer(seq)
+            start = time.perf_counter_ns()
+            client.set_target(*target)
+            self.timings.record(TRANSMIT, start)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(_REPORT_INTERVAL_S)
+            summary = self.timings.summary()
+            self.timings = frame_timing.FrameTimings(stage_names=STAGE_NAMES)
+            print(
+                " | ".join(
+                    "{}: {:.1f}/s mean {:.2f}ms p99 {:.2f}ms".format(
+                        name,
+                        summary[name]["count"] / _REPORT_INTERVAL_S,
+                        summary[name]["mean_us"] / 1000,
+                        summary[name]["p99_us"] / 1000,
+                    )
+                    for name in STAGE_NAMES
+                )
+            )
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        def transmit(*target: Any):
+            # Called from the ik thread.
+            loop.call_soon_threadsafe(self._targets.publish, target)
+
+        control.set_transmitter(transmit)
+        try:
+            await asyncio.gather(self._input(), self._telemetry(), self._ik(), self._transmit(), self._report())
+        finally:
+            control.set_transmitter(None)
+            self._ik_executor.shutdown(wait=False)
+
+
+def main():
+    asyncio.run(AsyncRunner(ControlModel(ControlMode.VIRTUAL_POINT)).run())
+
+
+if __name__ == "__main__":
+    main()
+    pygame.quit()
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+
+import asyncio
+import importlib
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from typing import Any
+from unittest import mock
+
+import numpy as np
+import pygame
+
+import stub_client
+
+# Imported in setUpModule, with the stub registered as client.
+async_control: Any = None
+
+
+def setUpModule():
+    global async_control
+    # control talks to whatever module is registered as client. Patching sys.modules restores
+    # it afterwards, so modules collected later still get the real client.
+    patcher = mock.patch.dict(sys.modules, {"client": stub_client})
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+    async_control = importlib.import_module("async_control")
+
+
+class TestLatestValue(unittest.IsolatedAsyncioTestCase):
+    async def test_drops_stale_values(self):
+        channel = async_control.LatestValue()
+        channel.publish(1)
+        channel.publish(2)
+        self.assertEqual(await channel.get_newer(0), (2, 2))
+
+    async def test_get_newer_wakes_on_publish(self):
+        channel = async_control.LatestValue()
+        channel.publish(1)
+        waiting = asyncio.create_task(channel.get_newer(1))
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        channel.publish(5)
+        self.assertEqual(await asyncio.wait_for(waiting, 5), (5, 2))
+
+
+class RecordingController:
+    def __init__(self):
+        self.calls = []
+
+    def handle_stick_input(self, v):
+        self.calls.append(("stick", v))
+
+    def handle_button_press(self, buttons):
+        self.calls.append(("buttons", list(buttons)))
+
+
+def button_events(*buttons):
+    return [SimpleNamespace(type=pygame.JOYBUTTONDOWN, button=b) for b in buttons]
+
+
+class TestButtons(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.controller = RecordingController()
+        self.runner = async_control.AsyncRunner(self.controller)
+
+    def tearDown(self):
+        self.runner._ik_executor.shutdown()
+
+    def sample(self, stick, events):
+        with (
+            mock.patch.object(pygame.joystick, "get_count", return_value=1),
+            mock.patch.object(pygame.joystick, "Joystick"),
+            mock.patch.object(async_control.control, "get_arm_direction", return_value=stick),
+            mock.patch.object(pygame.event, "get", return_value=events),
+        ):
+            self.runner._sample()
+
+    async def test_buttons_survive_dropped_sticks(self):
+        self.sample("first", button_events(0))
+        self.sample("second", button_events(3))
+        self.sample("third", [SimpleNamespace(type=pygame.JOYAXISMOTION)])
+        ik = asyncio.create_task(self.runner._ik())
+        try:
+            for _ in range(100):
+                if len(self.controller.calls) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            ik.cancel()
+        # The ik stage only sees the latest stick, but every button pressed before it.
+        self.assertEqual(self.controller.calls, [("stick", "third"), ("buttons", [0, 3])])
+        self.assertEqual(self.runner._pending_buttons, [])
+
+    def test_buttons_queue_without_joystick(self):
+        with (
+            mock.patch.object(pygame.joystick, "get_count", return_value=0),
+            mock.patch.object(pygame.event, "get", return_value=button_events(2)),
+        ):
+            self.runner._sample()
+        self.assertEqual(self.runner._pending_buttons, [2])
+        self.assertEqual(self.runner._sticks._seq, 0)
+
+
+class ArmController:
+    """Sends a target for every stick input, noting which thread it was called on."""
+
+    def __init__(self, control):
+        self._control = control
+        self.threads = set()
+
+    def handle_stick_input(self, v):
+        self.threads.add(threading.current_thread().name)
+        self._control.set_target_angles(np.array((0.0, 45.0, 45.0)) + v, 100)
+
+    def handle_button_press(self, buttons):
+        pass
+
+
+class TestRun(unittest.IsolatedAsyncioTestCase):
+    async def test_run(self):
+        stub_client.set_clock(time.monotonic, stub_client.sim_brick.SimBrick())
+        control = async_control.control
+        control.configure_command_filter(False)
+        controller = ArmController(control)
+        runner = async_control.AsyncRunner(controller)
+        sent_before = stub_client.targets_sent
+        with (
+            mock.patch.object(pygame.joystick, "get_count", return_value=1),
+            mock.patch.object(pygame.joystick, "Joystick"),
+            mock.patch.object(control, "get_arm_direction", side_effect=lambda j: np.random.uniform(-1, 1, 3)),
+            mock.patch.object(pygame.event, "get", return_value=[]),
+        ):
+            running = asyncio.create_task(runner.run())
+            await asyncio.sleep(0.3)
+            running.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await running
+
+        # The ControlModel was only called on the ik thread.
+        self.assertEqual(len(controller.threads), 1)
+        self.assertTrue(next(iter(controller.threads)).startswith("ik"))
+        self.assertGreater(stub_client.targets_sent, sent_before)
+        summary = runner.timings.summary()
+        for name in async_control.STAGE_NAMES:
+            self.assertGreater(summary[name]["count"], 0, name)
+        # Positions come every 33 ms, so none can be much older than that when taken in.
+        self.assertLess(summary["telemetry"]["max_us"], 100_000)
+        # The runner puts sending back the way it found it.
+        self.assertIs(control._transmit, stub_client.set_target)
+
+
+if __name__ == "__main__":
+    unittest.main()
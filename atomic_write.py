@@ -0,0 +1,21 @@
+#! /usr/bin/env python3
+
+"""Writing files so that a crash can't leave them truncated."""
+
+import os
+from typing import Any, Callable, IO
+
+
+def write_atomically(path: str, write: Callable[[IO[Any]], Any], mode: str = "wb"):
+    """Calls write with a file, opened with mode, to write the contents of path to. The
+    contents go to a temporary file first, which then replaces path. If write raises, path is
+    left as it was."""
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
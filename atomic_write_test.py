@@ -0,0 +1,40 @@
+#! /usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from atomic_write import write_atomically
+
+
+class TestWriteAtomically(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "file")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_replaces(self):
+        write_atomically(self.path, lambda f: f.write(b"old"))
+        write_atomically(self.path, lambda f: f.write("new"), mode="w")
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"new")
+        self.assertEqual(os.listdir(self._tmp.name), ["file"])
+
+    def test_failed_write_leaves_file(self):
+        write_atomically(self.path, lambda f: f.write(b"old"))
+
+        def write(f):
+            f.write(b"partial")
+            raise RuntimeError("crash")
+
+        with self.assertRaises(RuntimeError):
+            write_atomically(self.path, write)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"old")
+        self.assertEqual(os.listdir(self._tmp.name), ["file"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+
+"""Conversion between raw motor angles and logical joint angles.
+
+The brick reports motor angles in calibrated degrees ("raw"), which don't match the real
+joint angles because the calibration doesn't know the exact throw of each joint. Each joint
+has a reference angle where raw and logical agree, and the raw angles are scaled around it:
+
+    raw = reference + (logical - reference) * scale
+
+The kinematics module works in radians, the rest of the program in logical degrees.
+"""
+
+import numpy as np
+import numpy.typing as npt
+
+# The actual throw of each joint, in degrees.
+_TRUE_THROWS = np.array((180.0, 73.0, 167.0))
+
+# The angle at which raw and logical agree for each joint. 90 is where the turntable hits its
+# limit switch, and 17 and -6 are the minimum angles of arm1 and arm2.
+_REFERENCES = np.array((90.0, 17.0, -6.0))
+
+
+class Calibration:
+    def __init__(self, scale: npt.ArrayLike, reference: npt.ArrayLike = _REFERENCES):
+        """
+        Arguments:
+            scale: Raw degrees per logical degree, for each joint.
+            reference: The angle of each joint at which raw and logical agree.
+        """
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.reference = np.asarray(reference, dtype=np.float64)
+        # logical = raw * _to_logical_scale + _to_logical_offset
+        self._to_logical_scale = 1 / self.scale
+        self._to_logical_offset = self.reference * (1 - self._to_logical_scale)
+        # raw = logical * scale + _to_raw_offset
+        self._to_raw_offset = self.reference * (1 - self.scale)
+
+    @classmethod
+    def from_ranges(cls, ranges: npt.ArrayLike) -> "Calibration":
+        """Builds the calibration from the ranges reported by the brick, as returned by
+        client.ranges(): (turntable min, turntable max, arm1 min, arm1 max, arm2 min, arm2 max)."""
+        ranges = np.asarray(ranges, dtype=np.float64).reshape(3, 2)
+        return cls((ranges[:, 1] - ranges[:, 0]) / _TRUE_THROWS)
+
+    def raw_to_logical(self, raw: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        """Converts raw degrees to logical degrees. raw may be a single (3,) vector of joint angles
+        or an (N, 3) array of them."""
+        return np.asarray(raw, dtype=np.float64) * self._to_logical_scale + self._to_logical_offset
+
+    def logical_to_raw(self, logical: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        return np.asarray(logical, dtype=np.float64) * self.scale + self._to_raw_offset
+
+    def raw_to_radians(self, raw: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        return np.radians(self.raw_to_logical(raw))
+
+    def radians_to_raw(self, angles: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        return self.logical_to_raw(np.degrees(angles))
@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+
+import unittest
+from math import radians
+import numpy as np
+import numpy.testing as npt
+
+from calibration import Calibration
+
+# Ranges as reported by the brick: turntable, arm1, arm2 (min, max) in raw degrees.
+_RANGES = (-100, 90, 17, 90, -6, 180)
+
+
+class TestCalibration(unittest.TestCase):
+    def setUp(self):
+        self.calibration = Calibration.from_ranges(_RANGES)
+
+    def test_scale(self):
+        npt.assert_allclose(self.calibration.scale, (190 / 180, 73 / 73, 186 / 167))
+
+    def test_reference_is_fixed(self):
+        npt.assert_allclose(self.calibration.raw_to_logical((90, 17, -6)), (90, 17, -6))
+        npt.assert_allclose(self.calibration.logical_to_raw((90, 17, -6)), (90, 17, -6))
+
+    def test_matches_scalar_formulas(self):
+        raw = np.array((0.0, 50.0, 100.0))
+        turntable_scale, arm1_scale, arm2_scale = self.calibration.scale
+        npt.assert_allclose(
+            self.calibration.raw_to_logical(raw),
+            (90 - (90 - raw[0]) / turntable_scale, 17 + (raw[1] - 17) / arm1_scale, -6 + (raw[2] + 6) / arm2_scale),
+        )
+
+    def test_limits(self):
+        # The full raw range should map to the full logical throw.
+        npt.assert_allclose(self.calibration.raw_to_logical(np.reshape(_RANGES, (3, 2)).T), ((-90, 17, -6), (90, 90, 161)))
+
+    def test_round_trip_batch(self):
+        logical = np.random.default_rng(0).uniform(-90, 90, (100, 3))
+        raw = self.calibration.logical_to_raw(logical)
+        self.assertEqual(raw.shape, (100, 3))
+        npt.assert_allclose(self.calibration.raw_to_logical(raw), logical)
+
+    def test_radians(self):
+        npt.assert_allclose(self.calibration.raw_to_radians((90, 17, -6)), (radians(90), radians(17), radians(-6)))
+        npt.assert_allclose(self.calibration.radians_to_raw((radians(90), radians(17), radians(-6))), (90, 17, -6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,21 +1,31 @@
 #!/usr/bin/env python3
-from pybrickspc.messaging import BluetoothMailboxClient, Mailbox
+from pybrickspc.messaging import BluetoothMailboxClient, Mailbox, TCPMailboxClient
+import event_log
 import net_formats
+import os
 import struct
 import sys
+import threading
+import time
+from typing import NamedTuple
 
 
 if __name__ == '__main__':
     print('I think you meant to run client_test.py or something else.')
     sys.exit(1)
 
-# This is the address of the server EV3 we are connecting to.
-SERVER = "f0:45:da:13:1c:8a"
-
-_mailbox_client = BluetoothMailboxClient()
+# This is the address of the server EV3 we are connecting to. Set EV3_SERVER to
+# tcp:<host>:<port> to connect to a simulated brick (see sim_brick.py) instead.
+SERVER = os.environ.get("EV3_SERVER", "f0:45:da:13:1c:8a")
 
 print("establishing connection...")
-_mailbox_client.connect(SERVER)
+if SERVER.startswith("tcp:"):
+    _host, _port = SERVER[len("tcp:") :].rsplit(":", 1)
+    _mailbox_client = TCPMailboxClient()
+    _mailbox_client.connect((_host, int(_port)))
+else:
+    _mailbox_client = BluetoothMailboxClient()
+    _mailbox_client.connect(SERVER)
 print("connected!")
 
 
@@ -25,16 +35,68 @@ _ranges_mbox = Mailbox(net_formats.range_channel, _mailbox_client)
 
 
 def ranges():
+    # The reply can arrive before we would start waiting for it, so wait for it by number.
+    seq = _ranges_mbox.seq
     _ranges_mbox.send(struct.pack('!h', 1))
-    _ranges_mbox.wait()
+    _ranges_mbox.wait_for_seq(seq + 1)
     return struct.unpack_from(net_formats.range_format, _ranges_mbox.read())
 
 
+class Position(NamedTuple):
+    angles: tuple[int, int, int]
+    """The raw angle of each motor."""
+
+    timestamp: float
+    """time.monotonic() when the position arrived."""
+
+    seq: int
+    """Counts the positions received so far, starting at 1."""
+
+
+_position_cond = threading.Condition()
+_latest_position: Position | None = None
+
+
+def _read_positions():
+    """Thread that keeps _latest_position up to date, so readers never have to wait for the
+    next telemetry packet."""
+    global _latest_position
+    seq = 0
+    mailbox_seq = 0
+    while True:
+        _current_position_mbox.wait_for_seq(mailbox_seq + 1)
+        data, mailbox_seq = _current_position_mbox.read_with_seq()
+        angles = struct.unpack_from(net_formats.current_format, data)
+        seq += 1
+        with _position_cond:
+            _latest_position = Position(angles, time.monotonic(), seq)
+            _position_cond.notify_all()
+
+
+threading.Thread(target=_read_positions, name="position reader", daemon=True).start()
+
+
+def latest_position() -> Position | None:
+    """The most recently received position, or None if none has arrived yet. Never blocks."""
+    return _latest_position
+
+
+def wait_newer_than(seq: int, timeout: float | None = None) -> Position | None:
+    """Waits for a position with a sequence number greater than seq. Returns None on timeout."""
+    with _position_cond:
+        if not _position_cond.wait_for(lambda: _latest_position is not None and _latest_position.seq > seq, timeout):
+            return None
+        return _latest_position
+
+
 def current_position():
-    _current_position_mbox.wait()
-    return struct.unpack_from(net_formats.current_format, _current_position_mbox.read())
+    """Waits for the next position to arrive and returns it."""
+    latest = _latest_position
+    position = wait_newer_than(latest.seq if latest is not None else 0)
+    assert position is not None
+    return position.angles
 
 
 def set_target(ms_from_now: int, turntable_angle: int, arm1_angle: int, arm2_angle: int):
-    print('sending ', ms_from_now, turntable_angle, arm1_angle, arm2_angle)
+    event_log.log.info(event_log.SET_TARGET, ms_from_now, turntable_angle, arm1_angle, arm2_angle)
     _target_position_mbox.send(struct.pack(net_formats.target_format, ms_from_now, turntable_angle, arm1_angle, arm2_angle))
@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+
+"""Filtering of the target commands sent to the brick.
+
+The control loop produces a target every frame, but most of them are no different from the
+last one once rounded to whole degrees, and the brick can't make use of more than a few per
+telemetry interval anyway. Every command costs an RFCOMM packet, a print and a fresh
+run_target on the brick.
+
+CommandFilter holds back commands within a deadband of the last one sent, and sends at most
+one command per interval. A held back command is replaced by any later one. The last one is
+always sent: a command that arrived too early once the interval is up, and a command within
+the deadband once no other command has followed it for an interval. So the arm still ends up
+at the final resting target.
+"""
+
+import threading
+import time
+from typing import Any, Callable
+
+Command = tuple[int, int, int, int]
+"""Milliseconds from now, then the raw turntable, arm1 and arm2 angles."""
+
+
+class CommandFilter:
+    def __init__(
+        self,
+        send: Callable[[int, int, int, int], None],
+        deadband: int = 0,
+        min_interval_s: float = 1 / 30,
+        background: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Arguments:
+            send: Sends a command, e.g. client.set_target.
+            deadband: Commands with the same time whose angles are all within this many degrees
+                of the last command sent are held back, and only sent if no other command
+                follows within min_interval_s.
+            min_interval_s: The minimum time between two sent commands.
+            background: If set, held back commands are sent by a background thread, which is
+                started when the first command is held back and stopped by close(). Otherwise
+                poll() must be called regularly.
+            clock: The time source, in seconds.
+        """
+        self._send = send
+        self.deadband = deadband
+        self.min_interval_s = min_interval_s
+        self._background = background
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._last_sent: Command | None = None
+        self._last_send_time = float("-inf")
+        self._pending: Command | None = None
+        # When the pending command is due, and whether it is only waiting for input to settle
+        # because it was within the deadband.
+        self._pending_due = 0.0
+        self._pending_settling = False
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        # Commands are sent outside _cond, so that producers aren't blocked by a slow send.
+        # Each command claimed for sending gets a number, and a command is skipped if a later
+        # one has already been sent.
+        self._send_lock = threading.Lock()
+        self._claimed = 0
+        self._sent_seq = 0
+
+        self.submitted = 0
+        self.sent = 0
+        self.suppressed = 0
+        """Commands dropped because they repeated the last command sent, or were within the
+        deadband and replaced before the input came to rest."""
+        self.coalesced = 0
+        """Held back commands replaced by a later one before they were sent."""
+
+    def _within_deadband(self, command: Command) -> bool:
+        last = self._last_sent
+        if last is None or command[0] != last[0]:
+            return False
+        return all(abs(a - b) <= self.deadband for a, b in zip(command[1:], last[1:]))
+
+    def _claim_locked(self, command: Command) -> int:
+        self._last_sent = command
+        self._last_send_time = self._clock()
+        self.sent += 1
+        self._claimed += 1
+        return self._claimed
+
+    def _send_claimed(self, command: Command, seq: int):
+        with self._send_lock:
+            if seq < self._sent_seq:
+                return
+            self._send(*command)
+            self._sent_seq = seq
+
+    def _hold_locked(self, command: Command, due: float, settling: bool):
+        self._pending = command
+        self._pending_due = due
+        self._pending_settling = settling
+        if self._background and self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._send_pending_forever, name="command filter", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def submit(self, ms_from_now: int, turntable_angle: int, arm1_angle: int, arm2_angle: int):
+        """Sends the command now, later or not at all."""
+        command = (ms_from_now, turntable_angle, arm1_angle, arm2_angle)
+        claimed = None
+        with self._cond:
+            self.submitted += 1
+            if self._pending is not None:
+                # Whatever happens to this command, it supersedes the one held back.
+                if self._pending_settling:
+                    self.suppressed += 1
+                else:
+                    self.coalesced += 1
+                self._pending = None
+            now = self._clock()
+            if command == self._last_sent:
+                self.suppressed += 1
+            elif self._within_deadband(command):
+                # Only send it if it turns out to be where the input came to rest.
+                self._hold_locked(command, now + self.min_interval_s, settling=True)
+            elif now - self._last_send_time >= self.min_interval_s:
+                claimed = self._claim_locked(command)
+            else:
+                self._hold_locked(command, self._last_send_time + self.min_interval_s, settling=False)
+        if claimed is not None:
+            self._send_claimed(command, claimed)
+
+    def _take_due_locked(self) -> tuple[Command, int] | None:
+        if self._pending is None or self._clock() < self._pending_due:
+            return None
+        command, self._pending = self._pending, None
+        return command, self._claim_locked(command)
+
+    def poll(self):
+        """Sends the held back command, if there is one and it is due."""
+        with self._cond:
+            due = self._take_due_locked()
+        if due is not None:
+            self._send_claimed(*due)
+
+    def reset(self):
+        """Drops any held back command and forgets the last command sent. Call this when the
+        brick was sent commands by other means."""
+        with self._cond:
+            self._pending = None
+            self._last_sent = None
+            self._last_send_time = float("-inf")
+
+    def close(self):
+        """Stops the background thread, dropping any held back command."""
+        with self._cond:
+            self._closed = True
+            self._pending = None
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "suppressed": self.suppressed,
+                "coalesced": self.coalesced,
+                "saved_fraction": 1 - self.sent / self.submitted if self.submitted else 0.0,
+            }
+
+    def _send_pending_forever(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._pending is not None:
+                        delay = self._pending_due - self._clock()
+                        if delay <= 0:
+                            break
+                        # A newer command may replace the pending one while we wait.
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                due = self._take_due_locked()
+            if due is not None:
+                self._send_claimed(*due)
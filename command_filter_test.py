@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+
+import threading
+import time
+import unittest
+
+from command_filter import CommandFilter
+
+
+class TestCommandFilter(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.sent = []
+        self.filter = CommandFilter(
+            lambda *command: self.sent.append(command),
+            deadband=1,
+            min_interval_s=0.1,
+            background=False,
+            clock=lambda: self.now,
+        )
+
+    def test_deadband(self):
+        self.filter.submit(500, 10, 20, 30)
+        self.now = 1
+        self.filter.submit(500, 11, 19, 30)
+        self.filter.submit(500, 10, 20, 32)
+        self.now = 2
+        self.filter.submit(400, 10, 20, 30)
+        self.assertEqual(self.sent, [(500, 10, 20, 30), (500, 10, 20, 32), (400, 10, 20, 30)])
+        self.assertEqual(self.filter.suppressed, 1)
+
+    def test_final_target_within_deadband_is_sent(self):
+        self.filter.submit(500, 10, 20, 30)
+        self.now = 1
+        self.filter.submit(500, 11, 20, 30)
+        self.filter.poll()
+        self.assertEqual(self.sent, [(500, 10, 20, 30)])
+        self.now = 1.05
+        self.filter.submit(500, 11, 21, 30)
+        self.now = 1.12
+        self.filter.poll()
+        # The input hasn't been still for an interval yet.
+        self.assertEqual(self.sent, [(500, 10, 20, 30)])
+        self.now = 1.2
+        self.filter.poll()
+        self.assertEqual(self.sent, [(500, 10, 20, 30), (500, 11, 21, 30)])
+        self.assertEqual(self.filter.suppressed, 1)
+
+    def test_rate_limit_sends_final_target(self):
+        for i in range(10):
+            self.filter.submit(500, i * 10, 0, 0)
+            self.now += 0.02
+            self.filter.poll()
+        self.now += 0.1
+        self.filter.poll()
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual(self.sent[0], (500, 0, 0, 0))
+        self.assertEqual(self.sent[-1], (500, 90, 0, 0))
+        stats = self.filter.stats()
+        self.assertEqual((stats["submitted"], stats["sent"]), (10, 3))
+        self.assertAlmostEqual(stats["saved_fraction"], 0.7)
+
+    def test_return_to_last_sent_drops_pending(self):
+        self.filter.submit(500, 0, 0, 0)
+        self.filter.submit(500, 50, 0, 0)
+        self.filter.submit(500, 0, 0, 0)
+        self.now = 1
+        self.filter.poll()
+        self.assertEqual(self.sent, [(500, 0, 0, 0)])
+
+    def test_reset(self):
+        self.filter.submit(500, 0, 0, 0)
+        self.filter.submit(500, 50, 0, 0)
+        self.filter.reset()
+        self.filter.submit(500, 0, 0, 0)
+        self.assertEqual(self.sent, [(500, 0, 0, 0), (500, 0, 0, 0)])
+
+    def test_background(self):
+        sent = []
+        f = CommandFilter(lambda *command: sent.append(command), min_interval_s=0.05)
+        self.addCleanup(f.close)
+        self.assertIsNone(f._thread)
+        f.submit(500, 0, 0, 0)
+        f.submit(500, 1, 0, 0)
+        time.sleep(0.2)
+        self.assertEqual(sent, [(500, 0, 0, 0), (500, 1, 0, 0)])
+
+    def test_close_stops_thread(self):
+        f = CommandFilter(lambda *command: None, min_interval_s=0.05)
+        f.submit(500, 0, 0, 0)
+        f.submit(500, 1, 0, 0)
+        thread = f._thread
+        self.assertTrue(thread.is_alive())
+        f.close()
+        self.assertFalse(thread.is_alive())
+
+    def test_send_does_not_block_submit(self):
+        release = threading.Event()
+        sending = threading.Event()
+        sent = []
+
+        def send(*command):
+            sent.append(command)
+            if len(sent) == 1:
+                sending.set()
+                release.wait(5)
+
+        f = CommandFilter(send, min_interval_s=0.01)
+        self.addCleanup(f.close)
+        sender = threading.Thread(target=f.submit, args=(500, 0, 0, 0))
+        sender.start()
+        sending.wait(5)
+        # The first send is still in progress, but submitting doesn't wait for it.
+        f.submit(500, 1, 0, 0)
+        self.assertEqual(f.stats()["submitted"], 2)
+        release.set()
+        sender.join()
+        time.sleep(0.1)
+        self.assertEqual(sent, [(500, 0, 0, 0), (500, 1, 0, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
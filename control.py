@@ -1,15 +1,24 @@
 #! /usr/bin/env python3
 
+import calibration
 import client
+import command_filter
+import event_log
+import frame_timing
+import joystick_trace
 import kinematics
+import state_estimator
+import taught_program
+import trajectory
+import argparse
 import enum
+import os
 import numpy as np
 import numpy.typing as npt
 from numpy.linalg import norm
-from math import degrees, radians
 import time
 import pygame
-from typing import Annotated, Any, Literal, Sequence, cast
+from typing import Annotated, Any, Callable, Literal, Sequence, cast
 
 
 def input_gain(x: float):
@@ -26,6 +35,15 @@ Vec3 = npt.NDArray[np.number[Any]]
 # button 3: clear positions
 
 
+class Button(enum.IntEnum):
+    SAVE = 0
+    REPLAY = 2
+    CLEAR = 3
+
+
+_DEFAULT_PROGRAM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "taught_program.bin")
+
+
 def get_x(j: pygame.joystick.JoystickType):
     return input_gain(j.get_axis(0))
 
@@ -43,70 +61,119 @@ def get_arm_direction(j: pygame.joystick.JoystickType) -> Vec3:
 
 
 _RANGES = client.ranges()
+_CALIBRATION = calibration.Calibration.from_ranges(_RANGES)
+
+# Per stage timings of the control loop, or None when timing is off. Every timed stage checks
+# this before reading the clock, so turning timing off leaves only that check.
+_timings: frame_timing.FrameTimings | None = None
+
+
+def enable_timing(dump_path: str | None = None, dump_interval_s: float = 10.0) -> frame_timing.FrameTimings:
+    """Starts timing the stages of the control loop. If dump_path is given, the timings are
+    written there as JSON every dump_interval_s."""
+    global _timings
+    _timings = frame_timing.FrameTimings(dump_path=dump_path, dump_interval_s=dump_interval_s)
+    return _timings
 
-_turntable_true_throw = 180
-_turntable_scale = (_RANGES[1] - _RANGES[0]) / _turntable_true_throw
-_arm1_true_throw = 73
-_arm1_scale = (_RANGES[3] - _RANGES[2]) / _arm1_true_throw
-_arm2_true_throw = 167
-_arm2_scale = (_RANGES[5] - _RANGES[4]) / _arm2_true_throw
 
+def disable_timing():
+    global _timings
+    _timings = None
 
-def turntable_raw_to_logical(angle: float) -> float:
-    # 90 is the reference point for the turntable, so we scale the difference between 90 and the computed
-    # minimum.
-    diff = 90 - angle
-    return 90 - diff / _turntable_scale
 
+def timings() -> frame_timing.FrameTimings | None:
+    return _timings
 
-def turntable_logical_to_raw(angle: float) -> float:
-    diff = 90 - angle
-    return 90 - diff * _turntable_scale
 
+def get_current_angles(cached: bool = True) -> Vec3:
+    """The current logical angles of the motors. By default this uses the latest position received
+    from the brick, which is at most one telemetry interval old. With cached=False, waits for the
+    next position to arrive."""
+    if not cached:
+        return _CALIBRATION.raw_to_logical(client.current_position())
+    position = client.latest_position() or client.wait_newer_than(0)
+    assert position is not None
+    return _CALIBRATION.raw_to_logical(position.angles)
 
-def arm1_raw_to_logical(angle: float) -> float:
-    # 17 is the reference point for arm1, and it is also the minimum
-    diff = angle - 17
-    return 17 + diff / _arm1_scale
 
+_transmit: Callable[[int, int, int, int], None] = client.set_target
 
-def arm1_logical_to_raw(angle: float) -> float:
-    # 17 is the reference point for arm1, and it is also the minimum
-    diff = angle - 17
-    return 17 + diff * _arm1_scale
 
+def set_transmitter(transmit: Callable[[int, int, int, int], None] | None):
+    """Routes the commands from set_target_angles through transmit, which takes the same arguments
+    as client.set_target. None restores sending directly with client.set_target."""
+    global _transmit
+    _transmit = transmit if transmit is not None else client.set_target
 
-def arm2_raw_to_logical(angle: float) -> float:
-    # -6 is the reference point for arm2, and it is also the minimum.
-    diff = angle - (-6)
-    return (-6) + diff / _arm2_scale
 
+def _send_target(ms_from_now: int, turntable_angle: int, arm1_angle: int, arm2_angle: int):
+    _transmit(ms_from_now, turntable_angle, arm1_angle, arm2_angle)
 
-def arm2_logical_to_raw(angle: float) -> float:
-    # 17 is the reference point for arm2, and it is also the minimum
-    diff = angle - (-6)
-    return -6 + diff * _arm2_scale
 
+# The filter only starts its background thread once it first holds a command back.
+_command_filter: command_filter.CommandFilter | None = command_filter.CommandFilter(_send_target)
 
-def get_current_angles() -> Vec3:
-    (r1, r2, r3) = client.current_position()
-    return np.array(
-        (
-            turntable_raw_to_logical(r1),
-            arm1_raw_to_logical(r2),
-            arm2_raw_to_logical(r3),
+
+def configure_command_filter(
+    enabled: bool,
+    deadband: int = 0,
+    min_interval_s: float = 1 / 30,
+    clock: Callable[[], float] = time.monotonic,
+):
+    """Configures the filter that drops redundant commands from set_target_angles, see
+    command_filter. It is on by default.
+
+    With a clock other than time.monotonic, held back commands are only sent when
+    poll_command_filter is called."""
+    global _command_filter
+    if _command_filter is not None:
+        _command_filter.close()
+    _command_filter = (
+        command_filter.CommandFilter(
+            _send_target, deadband, min_interval_s, background=clock is time.monotonic, clock=clock
         )
+        if enabled
+        else None
     )
 
 
+def poll_command_filter():
+    if _command_filter is not None:
+        _command_filter.poll()
+
+
+def command_filter_stats() -> dict[str, Any] | None:
+    """How many commands the filter has dropped, or None if it is off."""
+    return _command_filter.stats() if _command_filter is not None else None
+
+
+def _reset_command_filter():
+    """Must be called before sending commands around the filter."""
+    if _command_filter is not None:
+        _command_filter.reset()
+
+
 def set_target_angles(v: np.ndarray, in_ms: int = 500):
-    r1, r2, r3 = v[0], v[1], v[2]
-    client.set_target(
-        in_ms,
-        int(turntable_logical_to_raw(r1)),
-        int(arm1_logical_to_raw(r2)),
-        int(arm2_logical_to_raw(r3)),
+    r1, r2, r3 = _CALIBRATION.logical_to_raw(v)
+    start = time.perf_counter_ns() if _timings is not None else 0
+    if _command_filter is not None:
+        _command_filter.submit(in_ms, int(r1), int(r2), int(r3))
+    else:
+        _transmit(in_ms, int(r1), int(r2), int(r3))
+    if _timings is not None:
+        _timings.record(frame_timing.SEND, start)
+
+
+def move_smoothly(v: np.ndarray, rate_hz: float = 30.0, min_duration: float = 0.0):
+    """Moves the arm to the logical angles v along a minimum jerk trajectory, instead of in a
+    single set_target jump. Blocks until the last command has been sent."""
+    start = client.latest_position() or client.wait_newer_than(0)
+    assert start is not None
+    path = trajectory.plan(
+        (start.angles, _CALIBRATION.logical_to_raw(v)), _RANGES, rate_hz=rate_hz, min_duration=min_duration
     )
+    _reset_command_filter()
+    trajectory.stream(path, _transmit)
 
 
 # get_current_xyz and set_target_xyz are the two locations where we convert from degrees to radians.
@@ -114,12 +181,40 @@ def set_target_angles(v: np.ndarray, in_ms: int = 500):
 
 
 def get_current_xyz() -> Vec3:
-    return kinematics.get_pos(np.vectorize(radians)(get_current_angles()))
+    start = time.perf_counter_ns() if _timings is not None else 0
+    pos = kinematics.get_pos(np.radians(get_current_angles()))
+    if _timings is not None:
+        _timings.record(frame_timing.POSITION, start)
+    return pos
+
+
+_ik_cache: kinematics.IKCache | None = None
+
+
+def set_ik_cache(enabled: bool, capacity: int = 256, resolution: float = 0.05):
+    """Turns the IK result cache used by set_target_xyz on or off. Turning it on always starts
+    with an empty cache."""
+    global _ik_cache
+    _ik_cache = kinematics.IKCache(capacity, resolution) if enabled else None
+
+
+def ik_cache() -> kinematics.IKCache | None:
+    """The IK result cache, for reading its hit/miss/eviction counters."""
+    return _ik_cache
 
 
-def set_target_xyz(target_xyz: Vec3, in_ms: int = 500):
-    sol = kinematics.get_motor_settings(target_xyz, initial_guess=get_current_angles())
-    sol.x = np.vectorize(degrees)(sol.x)
+def set_target_xyz(target_xyz: Vec3, in_ms: int = 500, previous: Vec3 | None = None):
+    """Sends the arm to target_xyz. If previous (in degrees) is given, the motor settings are
+    found incrementally from there rather than solved from scratch."""
+    start = time.perf_counter_ns() if _timings is not None else 0
+    if previous is not None:
+        sol = kinematics.get_motor_settings_incremental(target_xyz, np.radians(previous))
+    else:
+        solve = _ik_cache.get_motor_settings if _ik_cache is not None else kinematics.get_motor_settings
+        sol = solve(target_xyz, initial_guess=np.radians(get_current_angles()))
+    if _timings is not None:
+        _timings.record(frame_timing.IK, start)
+    sol.x = np.degrees(sol.x)
     set_target_angles(sol.x, in_ms)
     return sol
 
@@ -136,16 +231,87 @@ class ControlMode(enum.Enum):
 
 
 class ControlModel:
-    def __init__(self, c: ControlMode):
+    def __init__(
+        self,
+        c: ControlMode,
+        incremental_ik: bool = False,
+        program_path: str | None = _DEFAULT_PROGRAM_PATH,
+        estimate_state: bool = False,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """If incremental_ik is set, each frame's motor settings are found by stepping from the
+        previous frame's commanded settings instead of solving from scratch.
+
+        If estimate_state is set, REL mode moves relative to where the arm is estimated to be now,
+        rather than where the last telemetry said it was.
+
+        clock is the time source, in seconds. It has to match the timestamps of the positions
+        from client.
+
+        Taught positions are saved to program_path and loaded from it on startup, unless it is
+        None."""
         self._control_mode = c
+        self._clock = clock
         if c == ControlMode.VIRTUAL_POINT:
             self._point = get_current_xyz()
-            self._last_update = time.time()
+            self._last_update = self._clock()
+            # Loads (or builds) the reachability index now rather than on the first frame.
+            kinematics.is_reachable(self._point)
         self._prev_dir = None
+        self._incremental_ik = incremental_ik
+        self._last_angles: Vec3 | None = None
+        self._estimator = state_estimator.JointStateEstimator() if estimate_state else None
+        self._estimator_seq = 0
+        self._program_path = program_path
+        if program_path is not None:
+            self._program = taught_program.TaughtProgram.load_or_empty(program_path)
+        else:
+            self._program = taught_program.TaughtProgram()
 
     def handle_button_press(self, buttons: Sequence[int]):
-        if len(buttons) > 0:
-            print(buttons)
+        for button in buttons:
+            match button:
+                case Button.SAVE:
+                    position = client.latest_position() or client.wait_newer_than(0)
+                    assert position is not None
+                    self._program.add(position.angles)
+                    self._save_program()
+                case Button.REPLAY:
+                    self._replay()
+                case Button.CLEAR:
+                    self._program.clear()
+                    self._save_program()
+
+    def _get_estimated_xyz(self) -> Vec3:
+        """The current position, extrapolated from the telemetry with the state estimator."""
+        assert self._estimator is not None
+        position = client.latest_position() or client.wait_newer_than(0)
+        assert position is not None
+        if position.seq != self._estimator_seq:
+            self._estimator.update(_CALIBRATION.raw_to_logical(position.angles), position.timestamp)
+            self._estimator_seq = position.seq
+        return kinematics.get_pos(np.radians(self._estimator.predict(self._clock())))
+
+    def _save_program(self):
+        if self._program_path is not None:
+            self._program.save(self._program_path)
+
+    def _replay(self):
+        """Moves to the first taught position, then through the rest. Blocks until the last
+        command has been sent; the path is compiled ahead of time, so no IK runs in between."""
+        if len(self._program) == 0:
+            return
+        path = self._program.compile(_RANGES)
+        move_smoothly(_CALIBRATION.raw_to_logical(self._program.positions[0]))
+        _reset_command_filter()
+        trajectory.stream(path, _transmit)
+
+        # Pick up from wherever the replay left the arm.
+        end = _CALIBRATION.raw_to_logical(self._program.positions[-1])
+        self._last_angles = None
+        if self._control_mode == ControlMode.VIRTUAL_POINT:
+            self._point = kinematics.get_pos(np.radians(end))
+            self._last_update = self._clock()
 
     def handle_stick_input(self, v: Vec3):
         try:
@@ -171,20 +337,19 @@ class ControlModel:
     def _handle_stick_rel(self, v: Vec3):
         _MOVEMENT_SCALE = 2.0  # Max movement /s
         if self._prev_dir is None or norm(v) > 0.01 or norm(self._prev_dir) > 0.01:
-            print('----------')
-            print(v)
             # Try to apply this direction to the current position and set the target to that.
-            pos = get_current_xyz()
-            print(pos)
+            pos = self._get_estimated_xyz() if self._estimator is not None else get_current_xyz()
             scaled_dir = ControlModel._normalize_then_scale(v, _MOVEMENT_SCALE)
-            print(scaled_dir)
             new_pos = pos + scaled_dir
-            print(new_pos)
+            if __debug__:
+                event_log.log.debug(event_log.STICK_INPUT, *v)
+                event_log.log.debug(event_log.STICK_POSITION, *pos)
+                event_log.log.debug(event_log.STICK_STEP, *scaled_dir)
+                event_log.log.debug(event_log.STICK_TARGET, *new_pos)
             set_target_xyz(new_pos)
-            print('----------')
 
     def _handle_stick_virt_point(self, v: Vec3) -> None:
-        new_time = time.time()
+        new_time = self._clock()
         if new_time - self._last_update < 0.001:
             return
         delta = new_time - self._last_update
@@ -195,7 +360,14 @@ class ControlModel:
         scaled_v = ControlModel._normalize_then_scale(v, movement_this_step)
 
         new_pos = self._point + scaled_v
-        solver_result = set_target_xyz(new_pos)
+        if not kinematics.is_reachable(new_pos):
+            # Slide along the edge of the workspace instead of solving for a point we can't reach.
+            new_pos = kinematics.project_to_reachable(new_pos)
+            if norm(new_pos - self._point) < 0.001:
+                return
+        solver_result = set_target_xyz(new_pos, previous=self._last_angles)
+        if self._incremental_ik:
+            self._last_angles = solver_result.x
         err = solver_result.fun
         if err < 1:
             # We only update the virtual point if the target point is in or near the
@@ -212,37 +384,73 @@ pygame.init()
 print("pygame init done")
 
 
-def main():
+def main(record_path: str | None = None):
+    """Runs the arm from the joystick. With record_path set, the joystick input is also
+    written there as a joystick_trace."""
     # Used to manage how fast the screen updates.
     clock = pygame.time.Clock()
 
     controller = ControlModel(ControlMode.VIRTUAL_POINT)
-
-    while True:
-        if pygame.joystick.get_count() == 0:
-            # Don't do anything unless there is a joystick
-            clock.tick(1)
-            print("no joy")
-            continue
-
-
-        joysticks = [pygame.joystick.Joystick(j) for j in range(pygame.joystick.get_count())]
-
-        controller.handle_stick_input(get_arm_direction(joysticks[0]))
-
-        buttons = [
-            cast(int, event.button)
-            for event in pygame.event.get()
-            if event.type == pygame.JOYBUTTONDOWN
-        ]
-        controller.handle_button_press(buttons)
-
-        # Limit to 30 frames per second.
-        clock.tick(60)
+    trace: joystick_trace.TraceWriter | None = None
+    # The axes as they were read at the start of the frame. pygame.event.get() updates the
+    # joystick, so reading it again later in the frame would see the next frame's input.
+    stick = joystick_trace.RecordedJoystick()
+
+    try:
+        while True:
+            if pygame.joystick.get_count() == 0:
+                # Don't do anything unless there is a joystick
+                clock.tick(1)
+                print("no joy")
+                continue
+
+            frame_start = time.perf_counter_ns() if _timings is not None else 0
+            joysticks = [pygame.joystick.Joystick(j) for j in range(pygame.joystick.get_count())]
+
+            j = joysticks[0]
+            stick.axes = [j.get_axis(i) for i in range(j.get_numaxes())]
+            direction = get_arm_direction(stick)
+            if _timings is not None:
+                _timings.record(frame_timing.INPUT, frame_start)
+            controller.handle_stick_input(direction)
+
+            buttons = [
+                cast(int, event.button)
+                for event in pygame.event.get()
+                if event.type == pygame.JOYBUTTONDOWN
+            ]
+            controller.handle_button_press(buttons)
+            if record_path is not None:
+                if trace is None:
+                    trace = joystick_trace.TraceWriter(open(record_path, "wb"), len(stick.axes))
+                trace.write(stick.axes, buttons)
+            if _timings is not None:
+                _timings.record(frame_timing.FRAME, frame_start)
+                _timings.maybe_dump()
+
+            # Limit to 30 frames per second.
+            clock.tick(60)
+    finally:
+        if trace is not None:
+            trace.close()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="file to record the joystick input to, see joystick_trace.py")
+    parser.add_argument("--events", help="file to dump the event log to on exit, see event_log.py")
+    parser.add_argument("--timings", help="file to dump the per stage timings to periodically, see frame_timing.py")
+    args = parser.parse_args()
+    if args.timings:
+        enable_timing(args.timings)
+    try:
+        main(args.record)
+    finally:
+        if args.events:
+            event_log.log.dump_to(args.events)
+        if _timings is not None and args.timings:
+            # Runs shorter than the dump interval would otherwise leave nothing.
+            _timings.dump(args.timings)
     # If you forget this line, the program will 'hang'
     # on exit if running from IDLE.
     pygame.quit()
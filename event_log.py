@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""A cheap structured event log, for the hot paths on both the PC and the brick.
+
+Printing costs a lot on the brick's console and isn't free on the PC either, so instead of
+printing, hot paths log events: an event id and up to four numbers, packed into a fixed-size
+record in a preallocated ring buffer. Nothing is formatted until the log is dumped to a file
+and decoded:
+
+    ./event_log.py events.bin
+
+Each event has a level. Events below the log's level are dropped before anything is packed.
+Calls at DEBUG level are written inside `if __debug__:`, so running with -O (or MicroPython at
+optimisation level 1 or more) compiles them out entirely.
+
+This module is shared with main.py, so it sticks to what MicroPython supports.
+"""
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    from time import ticks_us as _ticks_us
+except ImportError:
+    from time import perf_counter_ns
+
+    def _ticks_us():
+        return perf_counter_ns() // 1000
+
+
+import _thread
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+_LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING"}
+
+# Event ids, with the name and argument names the decoder shows them with.
+STICK_INPUT = 1
+STICK_POSITION = 2
+STICK_STEP = 3
+STICK_TARGET = 4
+SET_TARGET = 5
+MOTOR_RUN = 6
+TARGET_RECEIVED = 7
+
+EVENTS = {
+    STICK_INPUT: ("stick_input", ("x", "y", "z")),
+    STICK_POSITION: ("stick_position", ("x", "y", "z")),
+    STICK_STEP: ("stick_step", ("x", "y", "z")),
+    STICK_TARGET: ("stick_target", ("x", "y", "z")),
+    SET_TARGET: ("set_target", ("ms", "turntable", "arm1", "arm2")),
+    MOTOR_RUN: ("motor_run", ("speed", "angle", "target")),
+    TARGET_RECEIVED: ("target_received", ("ms", "turntable", "arm1", "arm2")),
+}
+
+# Microseconds (wrapping), level, event id, a reserved zero halfword, then the arguments.
+# Only type codes that the brick's ustruct knows are used, so no pad bytes.
+_RECORD = "<IBBH4f"
+_RECORD_SIZE = struct.calcsize(_RECORD)
+# Magic, version, then the number of records lost to wrapping around.
+_HEADER = "<4sBI"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_MAGIC = b"EV3E"
+_VERSION = 1
+
+
+class EventLog:
+    def __init__(self, capacity=4096, level=DEBUG):
+        """Keeps the last capacity events at or above level."""
+        self.capacity = capacity
+        self.level = level
+        self._buffer = bytearray(capacity * _RECORD_SIZE)
+        self._lock = _thread.allocate_lock()
+        self._written = 0
+
+    def log(self, level, event, a=0.0, b=0.0, c=0.0, d=0.0):
+        if level < self.level:
+            return
+        with self._lock:
+            offset = (self._written % self.capacity) * _RECORD_SIZE
+            struct.pack_into(_RECORD, self._buffer, offset, _ticks_us() & 0xFFFFFFFF, level, event, 0, a, b, c, d)
+            self._written += 1
+
+    def debug(self, event, a=0.0, b=0.0, c=0.0, d=0.0):
+        self.log(DEBUG, event, a, b, c, d)
+
+    def info(self, event, a=0.0, b=0.0, c=0.0, d=0.0):
+        self.log(INFO, event, a, b, c, d)
+
+    def warning(self, event, a=0.0, b=0.0, c=0.0, d=0.0):
+        self.log(WARNING, event, a, b, c, d)
+
+    def clear(self):
+        with self._lock:
+            self._written = 0
+
+    def dump(self, f):
+        """Writes the events held, oldest first, to the binary file f."""
+        with self._lock:
+            count = min(self._written, self.capacity)
+            f.write(struct.pack(_HEADER, _MAGIC, _VERSION, self._written - count))
+            data = memoryview(self._buffer)
+            if self._written > self.capacity:
+                split = (self._written % self.capacity) * _RECORD_SIZE
+                f.write(data[split:])
+                f.write(data[:split])
+            else:
+                f.write(data[: count * _RECORD_SIZE])
+
+    def dump_to(self, path):
+        with open(path, "wb") as f:
+            self.dump(f)
+
+
+log = EventLog()
+"""The log the rest of the program writes to."""
+
+
+def decode(data):
+    """Decodes a dump. Returns the number of events lost, and a list of (seconds since the
+    first event, level, event name, {argument name: value}) for the events held."""
+    magic, version, lost = struct.unpack_from(_HEADER, data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("not an event log")
+    events = []
+    elapsed_us = 0
+    previous = None
+    for offset in range(_HEADER_SIZE, len(data) - _RECORD_SIZE + 1, _RECORD_SIZE):
+        ticks, level, event, _, *args = struct.unpack_from(_RECORD, data, offset)
+        if previous is not None:
+            elapsed_us += (ticks - previous) & 0xFFFFFFFF
+        previous = ticks
+        name, arg_names = EVENTS.get(event, ("event_{}".format(event), ("a", "b", "c", "d")))
+        events.append((elapsed_us / 1e6, level, name, dict(zip(arg_names, args))))
+    return lost, events
+
+
+def format_event(event):
+    t, level, name, args = event
+    return "{:12.6f} {:7} {} {}".format(
+        t,
+        _LEVEL_NAMES.get(level, str(level)),
+        name,
+        " ".join("{}={:g}".format(k, v) for k, v in args.items()),
+    )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Decodes an event log dump.")
+    parser.add_argument("dump")
+    args = parser.parse_args()
+    with open(args.dump, "rb") as f:
+        lost, events = decode(f.read())
+    if lost:
+        print("({} earlier events lost)".format(lost))
+    for event in events:
+        print(format_event(event))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+
+import io
+import struct
+import unittest
+
+import event_log
+from event_log import DEBUG, INFO, EventLog
+
+
+def round_trip(log: EventLog):
+    f = io.BytesIO()
+    log.dump(f)
+    return event_log.decode(f.getvalue())
+
+
+class TestEventLog(unittest.TestCase):
+    def test_round_trip(self):
+        log = EventLog(capacity=8)
+        log.info(event_log.SET_TARGET, 500, 10, 20, -6)
+        log.debug(event_log.STICK_INPUT, 0.5, 0.0, -1.0)
+        lost, events = round_trip(log)
+        self.assertEqual(lost, 0)
+        self.assertEqual(
+            [(level, name, args) for _, level, name, args in events],
+            [
+                (INFO, "set_target", {"ms": 500, "turntable": 10, "arm1": 20, "arm2": -6}),
+                (DEBUG, "stick_input", {"x": 0.5, "y": 0.0, "z": -1.0}),
+            ],
+        )
+        self.assertEqual(events[0][0], 0.0)
+        self.assertGreaterEqual(events[1][0], 0.0)
+
+    def test_level(self):
+        log = EventLog(capacity=8, level=INFO)
+        log.debug(event_log.STICK_INPUT, 1, 2, 3)
+        log.info(event_log.MOTOR_RUN, 100, 5, 10)
+        _, events = round_trip(log)
+        self.assertEqual([name for _, _, name, _ in events], ["motor_run"])
+
+    def test_wraps_around(self):
+        log = EventLog(capacity=4)
+        for i in range(10):
+            log.info(event_log.MOTOR_RUN, i)
+        lost, events = round_trip(log)
+        self.assertEqual(lost, 6)
+        self.assertEqual([args["speed"] for _, _, _, args in events], [6, 7, 8, 9])
+
+    def test_clear(self):
+        log = EventLog(capacity=4)
+        log.info(event_log.MOTOR_RUN, 1)
+        log.clear()
+        self.assertEqual(round_trip(log), (0, []))
+
+    def test_not_a_dump(self):
+        with self.assertRaises(ValueError):
+            event_log.decode(b"EV3J\x01\x00\x00\x00\x00")
+
+    def test_record_layout(self):
+        # Dumps from older builds and from the brick must keep decoding.
+        self.assertEqual(event_log._RECORD_SIZE, 24)
+        log = EventLog(capacity=2)
+        log.warning(event_log.MOTOR_RUN, 1.5, -2.0, 3.0, 4.0)
+        f = io.BytesIO()
+        log.dump(f)
+        record = f.getvalue()[event_log._HEADER_SIZE :]
+        self.assertEqual(len(record), 24)
+        self.assertEqual(record[4:8], bytes([event_log.WARNING, event_log.MOTOR_RUN, 0, 0]))
+        self.assertEqual(record[8:], struct.pack("<4f", 1.5, -2.0, 3.0, 4.0))
+
+    def test_format(self):
+        line = event_log.format_event((1.5, INFO, "motor_run", {"speed": 12.5, "angle": 3.0}))
+        self.assertEqual(line, "    1.500000 INFO    motor_run speed=12.5 angle=3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#! /usr/bin/env python3
+
+"""Low overhead timing of the stages of the control loop.
+
+Each stage has a fixed-size histogram with four buckets per power of two nanoseconds, so
+recording a duration is a few integer operations on a preallocated array, and percentiles
+are accurate to within 25%. Frames that take longer than the frame budget are counted
+separately.
+"""
+
+import json
+import time
+from array import array
+from typing import Any
+
+import atomic_write
+
+INPUT = 0
+"""Reading the joystick."""
+
+POSITION = 1
+"""Getting the arm's current position."""
+
+IK = 2
+"""Solving for the motor settings."""
+
+SEND = 3
+"""Sending the target to the brick."""
+
+FRAME = 4
+"""The whole frame, excluding the wait for the next one."""
+
+STAGE_NAMES = ("input", "position", "ik", "send", "frame")
+
+# Covers durations up to 2**40 ns, about 18 minutes.
+_BUCKETS = 4 * 38 + 4
+
+
+def _bucket(ns: int) -> int:
+    bits = ns.bit_length()
+    if bits <= 3:
+        return max(ns, 0)
+    # The exponent plus the two bits following the leading one.
+    return min((bits - 2) * 4 + ((ns >> (bits - 3)) & 3), _BUCKETS - 1)
+
+
+def _bucket_upper_bound(bucket: int) -> int:
+    """The largest duration that falls into bucket."""
+    if bucket < 4:
+        return bucket
+    shift = bucket // 4 - 1
+    return (((bucket % 4) + 5) << shift) - 1
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = array("q", bytes(8 * _BUCKETS))
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int):
+        self.buckets[_bucket(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p: float) -> int:
+        """An upper bound for the p-th percentile (0-100) of the recorded durations, in ns."""
+        if self.count == 0:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n > 0:
+                return min(_bucket_upper_bound(bucket), self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns / self.count / 1000 if self.count else 0.0,
+            "p50_us": self.percentile(50) / 1000,
+            "p95_us": self.percentile(95) / 1000,
+            "p99_us": self.percentile(99) / 1000,
+            "max_us": self.max_ns / 1000,
+        }
+
+
+class FrameTimings:
+    def __init__(
+        self,
+        frame_budget_s: float = 1 / 60,
+        dump_path: str | None = None,
+        dump_interval_s: float = 10.0,
+        stage_names: tuple[str, ...] = STAGE_NAMES,
+    ):
+        """
+        Arguments:
+            frame_budget_s: Frames taking longer than this are counted as overruns.
+            dump_path: If set, maybe_dump writes a summary here as JSON every dump_interval_s.
+            stage_names: The name of each stage, by stage number. Defaults to the stages of
+                the control loop.
+        """
+        self.stage_names = stage_names
+        self.stages = [Histogram() for _ in stage_names]
+        self.overruns = 0
+        self._frame_budget_ns = int(frame_budget_s * 1e9)
+        self._dump_path = dump_path
+        self._dump_interval_s = dump_interval_s
+        self._last_dump = time.monotonic()
+
+    def record(self, stage: int, start_ns: int):
+        """Records a stage that started at start_ns, as returned by time.perf_counter_ns()."""
+        self.record_elapsed(stage, time.perf_counter_ns() - start_ns)
+
+    def record_elapsed(self, stage: int, elapsed_ns: int):
+        """Records a duration measured some other way."""
+        self.stages[stage].record(elapsed_ns)
+        if stage == FRAME and elapsed_ns > self._frame_budget_ns:
+            self.overruns += 1
+
+    def summary(self) -> dict[str, Any]:
+        ret: dict[str, Any] = {name: stage.summary() for name, stage in zip(self.stage_names, self.stages)}
+        ret["overruns"] = self.overruns
+        ret["frame_budget_us"] = self._frame_budget_ns / 1000
+        return ret
+
+    def dump(self, path: str):
+        summary = self.summary()
+        atomic_write.write_atomically(path, lambda f: json.dump(summary, f, indent=2), mode="w")
+
+    def maybe_dump(self):
+        """Dumps the summary to the dump path if one is set and the dump interval has passed."""
+        if self._dump_path is None:
+            return
+        now = time.monotonic()
+        if now - self._last_dump >= self._dump_interval_s:
+            self._last_dump = now
+            self.dump(self._dump_path)
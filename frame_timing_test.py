@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import frame_timing
+from frame_timing import FrameTimings, Histogram, _bucket, _bucket_upper_bound
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets_are_contiguous(self):
+        for ns in range(1, 5000):
+            bucket = _bucket(ns)
+            self.assertLessEqual(ns, _bucket_upper_bound(bucket))
+            self.assertGreater(ns, _bucket_upper_bound(bucket - 1))
+
+    def test_percentile_within_25_percent(self):
+        h = Histogram()
+        for us in range(1, 1001):
+            h.record(us * 1000)
+        self.assertEqual(h.count, 1000)
+        for p in (50, 95, 99):
+            self.assertGreaterEqual(h.percentile(p), p * 10 * 1000)
+            self.assertLessEqual(h.percentile(p), p * 10 * 1000 * 1.25)
+        self.assertEqual(h.percentile(100), 1000 * 1000)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().summary()["p99_us"], 0)
+
+
+class TestFrameTimings(unittest.TestCase):
+    def test_overruns(self):
+        timings = FrameTimings(frame_budget_s=0.001)
+        timings.record(frame_timing.FRAME, time.perf_counter_ns())
+        timings.record(frame_timing.FRAME, time.perf_counter_ns() - 2_000_000)
+        timings.record(frame_timing.IK, time.perf_counter_ns() - 2_000_000)
+        summary = timings.summary()
+        self.assertEqual(summary["overruns"], 1)
+        self.assertEqual(summary["frame"]["count"], 2)
+        self.assertEqual(summary["ik"]["count"], 1)
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "timings.json")
+            timings = FrameTimings(dump_path=path, dump_interval_s=0)
+            timings.record(frame_timing.SEND, time.perf_counter_ns())
+            timings.maybe_dump()
+            with open(path) as f:
+                self.assertEqual(json.load(f)["send"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
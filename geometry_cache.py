@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+
+"""Tables precomputed over the box the arm can reach, cached on disk.
+
+The IK grid and the reachability index both sample the same cubic grid of points around the
+arm. They are slow to build, so each is saved as a .npy file and memory mapped, which means
+startup only pays for the pages that are actually touched. The cache file name contains a
+hash of the geometry, so changing the link lengths or joint bounds in kinematics.py causes
+the tables to be rebuilt on the next start.
+"""
+
+import os
+from typing import Callable
+import numpy as np
+import numpy.typing as npt
+
+import kinematics
+from atomic_write import write_atomically
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def workspace_grid(spacing: float) -> tuple[npt.NDArray[np.float64], float]:
+    """The points of a cubic grid covering the arm's reach, spacing apart.
+
+    Returns:
+        An (n, n, n, 3) array, where [i, j, k] holds the point origin + spacing * (i, j, k),
+        and origin, the coordinate of the first point along every axis.
+    """
+    reach = kinematics.get_reach()
+    n = int(np.ceil(2 * reach / spacing)) + 1
+    axis = -reach + spacing * np.arange(n)
+    return np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1), -reach
+
+
+def load_or_build(
+    name: str, spacing: float, build: Callable[[], np.ndarray], cache_dir: str | None = None
+) -> np.ndarray:
+    """Memory maps the cached array called name for the current geometry and spacing. If there
+    is none yet, it is computed with build and cached first."""
+    cache_dir = cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR
+    path = os.path.join(cache_dir, "{}_{}_{}.npy".format(name, kinematics.geometry_key(), spacing))
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        array = build()
+        write_atomically(path, lambda f: np.save(f, array))
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,41 @@
+#! /usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import numpy.testing as npt
+
+import geometry_cache
+import kinematics
+
+
+class TestGeometryCache(unittest.TestCase):
+    def test_workspace_grid(self):
+        points, origin = geometry_cache.workspace_grid(4.0)
+        self.assertEqual(origin, -kinematics.get_reach())
+        self.assertEqual(points.shape[3], 3)
+        npt.assert_array_equal(points[1, 2, 3], origin + 4.0 * np.array((1, 2, 3)))
+        self.assertGreaterEqual(points[-1, -1, -1, 0], kinematics.get_reach())
+
+    def test_load_or_build(self):
+        built = []
+
+        def build():
+            built.append(True)
+            return np.arange(6.0)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = geometry_cache.load_or_build("table", 2.0, build, cache_dir)
+            second = geometry_cache.load_or_build("table", 2.0, build, cache_dir)
+            self.assertEqual(built, [True])
+            self.assertIsInstance(second, np.memmap)
+            npt.assert_array_equal(first, second)
+            # Only the finished file is left behind.
+            (name,) = os.listdir(cache_dir)
+            self.assertTrue(name.startswith("table_{}_".format(kinematics.geometry_key())))
+            self.assertTrue(name.endswith(".npy"))
+
+
+if __name__ == "__main__":
+    unittest.main()
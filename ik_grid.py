@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+
+"""An optional IK backend that looks motor settings up in a precomputed grid.
+
+The grid covers the box that the arm can reach, with the closed form motor settings
+for every grid point. A lookup interpolates the eight surrounding grid points and then
+refines the result with a single Newton step, which is enough to bring the error well
+below the slop in the motors and gearing.
+
+The grid is cached on disk by geometry_cache, keyed by the geometry.
+"""
+
+import numpy as np
+import numpy.typing as npt
+from scipy.optimize import OptimizeResult
+
+import geometry_cache
+import kinematics
+
+Vec3 = kinematics.Vec3
+
+# Distance between grid points, in the same units as the link lengths.
+_DEFAULT_SPACING = 1.0
+
+# Residual below which a grid solution is considered a success. A single Newton step
+# doesn't always converge fully, but this is still well within the slop of the arm.
+_GRID_TOLERANCE = 0.1
+
+
+class IKGrid:
+    def __init__(self, grid: npt.NDArray[np.float64], origin: float, spacing: float):
+        """Wraps a grid of motor settings.
+
+        Arguments:
+            grid: An (n, n, n, 3) array. grid[i, j, k] holds the motor settings for
+                the point origin + spacing * (i, j, k).
+            origin: The coordinate of grid[0, 0, 0] along every axis.
+            spacing: The distance between neighboring grid points.
+        """
+        self.grid = grid
+        self.origin = origin
+        self.spacing = spacing
+        self._max_cell = np.array(grid.shape[:3]) - 2
+
+    @classmethod
+    def build(cls, spacing: float = _DEFAULT_SPACING) -> "IKGrid":
+        """Computes a new grid covering the arm's reach."""
+        points, origin = geometry_cache.workspace_grid(spacing)
+        grid, _ = kinematics.get_motor_settings_analytic_batch(points)
+        return cls(grid, origin, spacing)
+
+    @classmethod
+    def load_or_build(cls, cache_dir: str | None = None, spacing: float = _DEFAULT_SPACING) -> "IKGrid":
+        """Memory maps the cached grid for the current geometry, building and caching it first
+        if it does not exist yet."""
+        grid = geometry_cache.load_or_build("ik_grid", spacing, lambda: cls.build(spacing).grid, cache_dir)
+        return cls(grid, -kinematics.get_reach(), spacing)
+
+    def interpolate(self, target: Vec3) -> npt.NDArray[np.float64]:
+        """Trilinearly interpolates the motor settings for target from the grid."""
+        index = (np.asarray(target, dtype=np.float64) - self.origin) / self.spacing
+        cell = np.clip(np.floor(index).astype(int), 0, self._max_cell)
+        frac = np.clip(index - cell, 0.0, 1.0)
+        i, j, k = cell
+        corners = np.asarray(self.grid[i : i + 2, j : j + 2, k : k + 2])
+        weights = np.einsum(
+            "i,j,k->ijk",
+            (1 - frac[0], frac[0]),
+            (1 - frac[1], frac[1]),
+            (1 - frac[2], frac[2]),
+        )
+        return np.einsum("ijk,ijkl->l", weights, corners)
+
+    def solve(self, target: Vec3) -> OptimizeResult:
+        """Finds the motor settings for target. The result has the same shape as
+        kinematics.get_motor_settings."""
+        x = kinematics.ik_step(self.interpolate(target), target)
+        err = kinematics.get_err(x, target)
+        success = bool(err < _GRID_TOLERANCE)
+        return OptimizeResult(
+            x=x,
+            fun=err,
+            success=success,
+            nit=1,
+            message="grid solution" if success else "target out of reach",
+        )
+
+
+_grid: IKGrid | None = None
+
+
+def get_grid() -> IKGrid:
+    """The process wide grid, loaded from the cache on first use."""
+    global _grid
+    if _grid is None:
+        _grid = IKGrid.load_or_build()
+    return _grid
+
+
+def get_motor_settings(target: Vec3) -> OptimizeResult:
+    return get_grid().solve(target)
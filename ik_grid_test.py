@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from math import radians
+import numpy as np
+import numpy.testing as npt
+
+import kinematics
+from ik_grid import IKGrid
+
+
+class TestIKGrid(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_solve(self):
+        grid = IKGrid.load_or_build(self.cache_dir, spacing=2.0)
+        for input in [(0, radians(45), 0), (radians(-45), radians(30), radians(90)), (radians(60), radians(70), radians(20))]:
+            target = kinematics.get_pos(input)
+            sol = grid.solve(target)
+            self.assertTrue(sol.success)
+            npt.assert_allclose(kinematics.get_pos(sol.x), target, atol=0.1)
+
+    def test_interpolate_matches_grid_points(self):
+        grid = IKGrid.build(spacing=4.0)
+        npt.assert_allclose(grid.interpolate(grid.origin + 4.0 * np.array((3, 5, 7))), grid.grid[3, 5, 7])
+
+    def test_cache_is_reused(self):
+        IKGrid.load_or_build(self.cache_dir, spacing=4.0)
+        (name,) = os.listdir(self.cache_dir)
+        with mock.patch.object(IKGrid, "build") as build:
+            grid = IKGrid.load_or_build(self.cache_dir, spacing=4.0)
+            build.assert_not_called()
+        self.assertIsInstance(grid.grid, np.memmap)
+        self.assertEqual(os.listdir(self.cache_dir), [name])
+
+    def test_cache_is_rebuilt_when_geometry_changes(self):
+        IKGrid.load_or_build(self.cache_dir, spacing=4.0)
+        with mock.patch.object(kinematics, "_l3", 16.0):
+            IKGrid.load_or_build(self.cache_dir, spacing=4.0)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
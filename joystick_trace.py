@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+
+"""Recording and replay of joystick input, for repeatable control loop workloads.
+
+A trace is a compact binary file: a header with the number of axes, then one record per frame
+with the frame's time, every joystick axis and the buttons pressed during the frame. Replaying a
+trace feeds the same input to a ControlModel, either in real time or as fast as possible with
+the ControlModel's clock following the trace.
+
+To replay against the in-process simulated brick (see stub_client.py):
+
+    ./joystick_trace.py trace.bin --client stub --fast
+
+Without --client stub, the replay connects to EV3_SERVER like control.py does.
+"""
+
+import argparse
+import json
+import struct
+import sys
+import time
+from typing import BinaryIO, Callable, Iterable, NamedTuple, Sequence
+
+_HEADER = struct.Struct("<4sBB")
+_MAGIC = b"EV3J"
+_VERSION = 1
+# Time since the start of the trace in seconds, then the number of buttons pressed.
+_FRAME = struct.Struct("<dB")
+
+
+class Frame(NamedTuple):
+    time: float
+    axes: tuple[float, ...]
+    buttons: tuple[int, ...]
+
+
+class TraceWriter:
+    """Writes frames to a trace file as they happen."""
+
+    def __init__(self, f: BinaryIO, num_axes: int, clock: Callable[[], float] = time.monotonic):
+        self._f = f
+        self._axes = struct.Struct("<{}f".format(num_axes))
+        self._clock = clock
+        self._start = clock()
+        f.write(_HEADER.pack(_MAGIC, _VERSION, num_axes))
+
+    def write(self, axes: Sequence[float], buttons: Sequence[int]):
+        self._f.write(_FRAME.pack(self._clock() - self._start, len(buttons)))
+        self._f.write(self._axes.pack(*axes))
+        self._f.write(bytes(buttons))
+
+    def close(self):
+        self._f.close()
+
+
+def read_trace(f: BinaryIO) -> list[Frame]:
+    data = f.read()
+    magic, version, num_axes = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("not a joystick trace")
+    axes = struct.Struct("<{}f".format(num_axes))
+    frames = []
+    offset = _HEADER.size
+    while offset < len(data):
+        t, num_buttons = _FRAME.unpack_from(data, offset)
+        offset += _FRAME.size
+        frame_axes = axes.unpack_from(data, offset)
+        offset += axes.size
+        frames.append(Frame(t, frame_axes, tuple(data[offset : offset + num_buttons])))
+        offset += num_buttons
+    return frames
+
+
+class RecordedJoystick:
+    """Stands in for a pygame joystick, returning the axes of the current frame."""
+
+    def __init__(self):
+        self.axes: Sequence[float] = ()
+
+    def get_axis(self, i: int) -> float:
+        return self.axes[i]
+
+
+class ReplayClock:
+    """A clock that only moves when told to, for replaying faster than real time."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def replay(
+    frames: Iterable[Frame],
+    controller,
+    get_arm_direction,
+    realtime: bool = True,
+    clock: ReplayClock | None = None,
+    after_frame: Callable[[], None] | None = None,
+) -> int:
+    """Feeds frames to controller (a ControlModel). Returns the number of frames replayed.
+
+    get_arm_direction turns a joystick into a stick vector, normally control.get_arm_direction.
+    With realtime set, the frames are fed at the times they were recorded. Otherwise they are
+    fed as fast as possible, and clock (which should be the controller's clock) is set to each
+    frame's time, plus its start time, before the frame is fed. after_frame, if given, is
+    called after each frame.
+    """
+    joystick = RecordedJoystick()
+    start = time.monotonic()
+    clock_start = clock.now if clock is not None else 0.0
+    count = 0
+    for frame in frames:
+        if realtime:
+            delay = start + frame.time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        elif clock is not None:
+            clock.now = clock_start + frame.time
+        joystick.axes = frame.axes
+        controller.handle_stick_input(get_arm_direction(joystick))
+        controller.handle_button_press(frame.buttons)
+        if after_frame is not None:
+            after_frame()
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible")
+    parser.add_argument("--client", choices=("real", "stub"), default="real")
+    parser.add_argument("--incremental-ik", action="store_true")
+    parser.add_argument("--output", help="file to write the timing summary to as JSON")
+    args = parser.parse_args()
+
+    with open(args.trace, "rb") as f:
+        frames = read_trace(f)
+
+    clock = ReplayClock()
+    if args.client == "stub":
+        import stub_client
+
+        if args.fast:
+            stub_client.set_clock(clock)
+        # control talks to whatever module is registered as client.
+        sys.modules["client"] = stub_client
+
+    import control
+
+    if args.fast:
+        control.configure_command_filter(True, clock=clock)
+    timings = control.enable_timing()
+    controller = control.ControlModel(
+        control.ControlMode.VIRTUAL_POINT,
+        incremental_ik=args.incremental_ik,
+        program_path=None,
+        clock=clock if args.fast else time.monotonic,
+    )
+    start = time.perf_counter()
+    count = replay(
+        frames,
+        controller,
+        control.get_arm_direction,
+        realtime=not args.fast,
+        clock=clock,
+        after_frame=control.poll_command_filter,
+    )
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        "frames": count,
+        "wall_time_s": elapsed,
+        "trace_time_s": frames[-1].time if frames else 0.0,
+        "timings": timings.summary(),
+        "commands": control.command_filter_stats(),
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+
+import io
+import unittest
+
+import stub_client
+from joystick_trace import Frame, ReplayClock, TraceWriter, read_trace, replay
+
+
+class RecordingController:
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def handle_stick_input(self, v):
+        self.calls.append(("stick", self.clock(), v))
+
+    def handle_button_press(self, buttons):
+        self.calls.append(("buttons", self.clock(), buttons))
+
+
+class TestTrace(unittest.TestCase):
+    def test_round_trip(self):
+        clock = ReplayClock(100.0)
+        f = io.BytesIO()
+        writer = TraceWriter(f, 3, clock)
+        writer.write((0.5, -0.25, 0.0), [])
+        clock.now = 100.5
+        writer.write((1.0, 0.0, -1.0), [0, 3])
+        f.seek(0)
+        self.assertEqual(
+            read_trace(f),
+            [Frame(0.0, (0.5, -0.25, 0.0), ()), Frame(0.5, (1.0, 0.0, -1.0), (0, 3))],
+        )
+
+    def test_not_a_trace(self):
+        with self.assertRaises(ValueError):
+            read_trace(io.BytesIO(b"EV3P\x01\x00"))
+
+    def test_replay_follows_trace_time(self):
+        clock = ReplayClock(10.0)
+        controller = RecordingController(clock)
+        frames = [Frame(0.0, (0.5,), ()), Frame(0.25, (-0.5,), (2,))]
+        count = replay(frames, controller, lambda j: j.get_axis(0), realtime=False, clock=clock)
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            controller.calls,
+            [
+                ("stick", 10.0, 0.5),
+                ("buttons", 10.0, ()),
+                ("stick", 10.25, -0.5),
+                ("buttons", 10.25, (2,)),
+            ],
+        )
+
+
+class TestStubClient(unittest.TestCase):
+    def setUp(self):
+        self.clock = ReplayClock()
+        stub_client.set_clock(self.clock, stub_client.sim_brick.SimBrick())
+
+    def test_telemetry_follows_clock(self):
+        self.assertEqual(stub_client.latest_position().seq, 1)
+        self.clock.now = 0.1
+        position = stub_client.latest_position()
+        self.assertEqual(position.seq, 4)
+        self.assertAlmostEqual(position.timestamp, 0.099)
+        # The clock isn't moving, so there is nothing newer to wait for.
+        self.assertIsNone(stub_client.wait_newer_than(position.seq))
+
+    def test_set_target_moves_brick(self):
+        stub_client.set_target(200, 0, 50, 10)
+        self.clock.now = 1.0
+        self.assertEqual(stub_client.current_position(), (0, 50, 10))
+        self.assertEqual(stub_client.targets_sent, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -30,12 +30,16 @@
 # Calibrated degrees will not match the exact number of degrees, so to get
 # correct movement we have to scale all motor movements accordingly.
 
-from math import sin, cos, radians
+from math import sin, cos, hypot, radians
 import numpy as np
 from numpy.linalg import norm
 import numpy.typing as npt
 from typing import Annotated, Literal, TypeVar, Any
-from scipy.optimize import minimize
+from collections import OrderedDict
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import minimize, OptimizeResult
 
 _r1 = 2.0
 _l2 = 20.0
@@ -43,12 +47,39 @@ _l3 = 15.0
 
 Vec3 = npt.NDArray[np.number[Any]]
 
+def get_radius_batch(angles: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """get_radius for an (N, 3) array of motor settings. Returns an array of N radii."""
+    angles = np.asarray(angles, dtype=np.float64)
+    return _r1 + _l2 * np.sin(angles[..., 1]) + _l3 * np.sin(angles[..., 1] + angles[..., 2])
+
+
+def get_pos_batch(angles: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """get_pos for an (N, 3) array of motor settings. Returns an (N, 3) array of positions."""
+    angles = np.asarray(angles, dtype=np.float64)
+    ar = angles[..., 0]
+    a2 = angles[..., 1]
+    a3 = angles[..., 2]
+
+    r = get_radius_batch(angles)
+
+    ret = np.empty(angles.shape, dtype=np.float64)
+    ret[..., 0] = r * np.cos(ar)
+    ret[..., 1] = _l2 * np.cos(a2) + _l3 * np.cos(a2 + a3)
+    ret[..., 2] = r * np.sin(ar)
+    return ret
+
+
+def get_err_batch(angles: npt.ArrayLike, target: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """get_err for an (N, 3) array of motor settings. target may be a single position or an
+    (N, 3) array with one position per row. Returns an array of N errors."""
+    return norm(np.asarray(target) - get_pos_batch(angles), axis=-1)
+
+
 def get_radius(input: Vec3) -> float:
     return _r1 + _l2 * sin(input[1]) + _l3 * sin(input[1] + input[2])
 
 
-def get_pos(input: Vec3) -> Vec3:
-    """Finds the X,Y,Z vector given the settings of each motor. The settings of the motors are given in radians from their neutral positions."""
+def _get_xyz(input: Vec3) -> tuple[float, float, float]:
     ar = input[0]
     a2 = input[1]
     a3 = input[2]
@@ -58,19 +89,337 @@ def get_pos(input: Vec3) -> Vec3:
     x = r * cos(ar)
     y = _l2 * cos(a2) + _l3 * cos(a2 + a3)
     z = r * sin(ar)
-    ret = np.array((x, y, z))
-    return ret
+    return x, y, z
+
+
+def get_pos(input: Vec3) -> Vec3:
+    """Finds the X,Y,Z vector given the settings of each motor. The settings of the motors are given in radians from their neutral positions."""
+    return np.array(_get_xyz(input))
+
+
+def get_err(input:Vec3, target: Vec3) -> float:
+    # This is the optimizer's objective, so it avoids building arrays.
+    x, y, z = _get_xyz(input)
+    return hypot(target[0] - x, target[1] - y, target[2] - z)
+
+
+def get_jacobian(input: Vec3) -> npt.NDArray[np.float64]:
+    """The 3x3 Jacobian of get_pos. Row i is the derivative of coordinate i (X, Y, Z), column j
+    is the derivative with respect to motor j."""
+    ar = input[0]
+    a2 = input[1]
+    a23 = input[1] + input[2]
+
+    r = get_radius(input)
+    # The arm's reach changes with the arm's height and vice versa.
+    dr_da2 = _l2 * cos(a2) + _l3 * cos(a23)
+    dr_da3 = _l3 * cos(a23)
+    dy_da2 = -(_l2 * sin(a2) + _l3 * sin(a23))
+    dy_da3 = -_l3 * sin(a23)
+
+    return np.array(
+        (
+            (-r * sin(ar), dr_da2 * cos(ar), dr_da3 * cos(ar)),
+            (0.0, dy_da2, dy_da3),
+            (r * cos(ar), dr_da2 * sin(ar), dr_da3 * sin(ar)),
+        )
+    )
+
+
+def get_err_grad(input: Vec3, target: Vec3) -> npt.NDArray[np.float64]:
+    """The gradient of get_err with respect to the motor settings."""
+    diff = get_pos(input) - target
+    err = norm(diff)
+    if err == 0:
+        # The norm is not differentiable at zero, but this is the minimum anyway.
+        return np.zeros(3)
+    return get_jacobian(input).T @ diff / err
+
+
+_BOUNDS = ((radians(-90), radians(90)), (radians(17), radians(90)), (radians(-6), radians(161)))
+
+
+# Residual below which a closed form solution is considered exact.
+_ANALYTIC_TOLERANCE = 1e-6
+
+
+_LOWER_BOUNDS = np.array([lo for lo, _ in _BOUNDS])
+_UPPER_BOUNDS = np.array([hi for _, hi in _BOUNDS])
+
+
+def get_reach() -> float:
+    """The furthest the end of the arm can be from the turntable axis at arm1's height."""
+    return _r1 + _l2 + _l3
+
+
+def geometry_key() -> str:
+    """A short hash of the arm geometry, for naming caches derived from it."""
+    geometry = (_r1, _l2, _l3, _BOUNDS)
+    return hashlib.sha1(repr(geometry).encode("utf-8")).hexdigest()[:16]
+
+
+def _clamp(angles: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    return np.clip(angles, _LOWER_BOUNDS, _UPPER_BOUNDS)
 
 
-def get_err(input:Vec3, target: Vec3) -> np.floating:
-    return norm(target - get_pos(input))
+def _analytic_candidates(targets: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """The closed form joint solutions for an (N, 3) array of targets, before clamping.
 
+    Returns an (N, 4, 3) array. The turntable angle points the arm's plane at the target,
+    either facing it or facing away from it (in which case the arm has to reach backwards).
+    Within that plane, arm1 and arm2 form a two link chain whose elbow angle follows from
+    the law of cosines. Both elbow directions are tried."""
+    x = targets[..., 0, np.newaxis]
+    y = targets[..., 1, np.newaxis]
+    z = targets[..., 2, np.newaxis]
+    horizontal = np.hypot(x, z)
 
-def get_motor_settings(target: Vec3, initial_guess: npt.ArrayLike):
-    # I tried to differentiate this and I got a headache. Finite estimation methods ftw.
+    ar = np.concatenate((np.arctan2(z, x), np.arctan2(-z, -x)), axis=-1).repeat(2, axis=-1)
+    u = np.concatenate((horizontal - _r1, -horizontal - _r1), axis=-1).repeat(2, axis=-1)
+    # If the target is unreachable we stretch (or fold) the arm toward it instead.
+    c3 = np.clip((u * u + y * y - _l2 * _l2 - _l3 * _l3) / (2 * _l2 * _l3), -1.0, 1.0)
+    a3 = np.arccos(c3) * (1, -1, 1, -1)
+    a2 = np.arctan2(u, y) - np.arctan2(_l3 * np.sin(a3), _l2 + _l3 * np.cos(a3))
+    return np.stack((ar, a2, a3), axis=-1)
+
+
+def get_motor_settings_analytic_batch(
+    targets: npt.ArrayLike,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """get_motor_settings_analytic for an (N, 3) array of targets.
+
+    Returns an (N, 3) array of motor settings and an array of N residual errors."""
+    targets = np.asarray(targets, dtype=np.float64)
+    candidates = _clamp(_analytic_candidates(targets))
+    errs = get_err_batch(candidates, targets[..., np.newaxis, :])
+    best = np.argmin(errs, axis=-1)[..., np.newaxis]
+    return (
+        np.take_along_axis(candidates, best[..., np.newaxis], axis=-2)[..., 0, :],
+        np.take_along_axis(errs, best, axis=-1)[..., 0],
+    )
+
+
+def get_motor_settings_analytic(target: Vec3) -> OptimizeResult:
+    """Solves for the motor settings that reach target in closed form.
+
+    Solutions are clamped to the joint bounds, and the one with the smallest residual
+    error is returned. success is False if the target is not exactly reachable."""
+    x, err = get_motor_settings_analytic_batch(target)
+    success = bool(err < _ANALYTIC_TOLERANCE)
+    return OptimizeResult(
+        x=x,
+        fun=err[()],
+        success=success,
+        nit=0,
+        message="exact solution" if success else "target out of reach",
+    )
+
+
+def ik_step(input: Vec3, target: Vec3, damping: float = 1e-3) -> npt.NDArray[np.float64]:
+    """Takes a single damped least squares (Levenberg-Marquardt) step from input toward target.
+
+    With damping=0 this is a plain Newton step. Some damping keeps the step bounded near
+    singular configurations, e.g. with the arm fully stretched. The result is clamped to
+    the joint bounds."""
+    jac = get_jacobian(input)
+    diff = np.asarray(target) - get_pos(input)
+    step = jac.T @ np.linalg.solve(jac @ jac.T + damping**2 * np.eye(3), diff)
+    return _clamp(np.asarray(input) + step)
+
+
+def get_motor_settings_slsqp(target: Vec3, initial_guess: npt.ArrayLike | None = None) -> OptimizeResult:
     initial_guess = initial_guess if initial_guess is not None else (0, 0, 0)
-    return minimize(get_err, initial_guess, args=(target,), method="slsqp", jac="3-point", bounds=((radians(-90), radians(90)), (radians(17), radians(90)), (radians(-6), radians(161))))
+    return minimize(get_err, initial_guess, args=(target,), method="slsqp", jac=get_err_grad, bounds=_BOUNDS)
+
+
+def get_motor_settings(
+    target: Vec3,
+    initial_guess: npt.ArrayLike | None = None,
+    method: Literal["auto", "analytic", "slsqp", "grid"] = "auto",
+) -> OptimizeResult:
+    """Finds the motor settings (in radians) that put the end of the arm closest to target.
+
+    method selects the solver:
+    * "analytic": the closed form solution, clamped to the joint bounds.
+    * "slsqp": the iterative optimizer, starting from initial_guess.
+    * "auto": the closed form solution, refined by the optimizer only if the target
+      is not exactly reachable (the clamped solution is not necessarily the closest
+      reachable point).
+    * "grid": interpolation in a precomputed grid of solutions, see ik_grid.
+    """
+    match method:
+        case "analytic":
+            return get_motor_settings_analytic(target)
+        case "slsqp":
+            return get_motor_settings_slsqp(target, initial_guess)
+        case "auto":
+            sol = get_motor_settings_analytic(target)
+            if sol.success:
+                return sol
+            refined = get_motor_settings_slsqp(target, sol.x)
+            return refined if refined.fun < sol.fun else sol
+        case "grid":
+            import ik_grid  # ik_grid depends on this module, so it is imported on demand.
+
+            return ik_grid.get_motor_settings(target)
+        case _:
+            raise ValueError("unknown method: {}".format(method))
+
+
+def is_reachable(xyz: Vec3) -> bool:
+    """Whether the arm can reach xyz, answered from the precomputed index in reachability
+    without solving."""
+    import reachability  # reachability depends on this module, so it is imported on demand.
+
+    return reachability.get_index().is_reachable(xyz)
+
+
+def project_to_reachable(xyz: Vec3) -> Vec3:
+    """The reachable point closest to xyz, or xyz itself if it is reachable."""
+    import reachability
+
+    return reachability.get_index().project(xyz)
+
+
+def get_motor_settings_incremental(
+    target: Vec3,
+    previous: Vec3,
+    tolerance: float = 0.05,
+    steps: int = 1,
+    method: Literal["auto", "analytic", "slsqp", "grid"] = "auto",
+) -> OptimizeResult:
+    """Finds the motor settings for target by taking a few ik_steps from previous, a nearby
+    solution such as the previous frame's.
+
+    This costs a fixed amount of work as long as target moves smoothly. If the residual
+    error is still above tolerance afterwards, falls back to get_motor_settings."""
+    x = np.asarray(previous, dtype=np.float64)
+    for _ in range(steps):
+        x = ik_step(x, target)
+    err = get_err(x, target)
+    if err < tolerance:
+        return OptimizeResult(x=x, fun=err, success=True, nit=steps, message="incremental step")
+    return get_motor_settings(target, previous, method)
+
+
+# Refining a target that is out of reach takes about 0.3-0.5 ms with SLSQP, and starting a
+# process pool about 20 ms, so a pool only pays off with a couple of hundred such targets and
+# more than one CPU.
+_POOL_MIN_TARGETS = 200
+
+
+def _refine(
+    targets: npt.NDArray[np.float64], guesses: npt.NDArray[np.float64]
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Refines the clamped closed form solutions of targets that are out of reach with the
+    optimizer, keeping whichever is closer, like the "auto" method."""
+    angles = guesses.copy()
+    errs = get_err_batch(guesses, targets)
+    for i, target in enumerate(targets):
+        sol = get_motor_settings_slsqp(target, guesses[i])
+        if sol.fun < errs[i]:
+            angles[i] = sol.x
+            errs[i] = sol.fun
+    return angles, errs
+
+
+def solve_many(
+    targets: npt.ArrayLike,
+    workers: int | None = None,
+    chunk_size: int | None = None,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Finds the motor settings for an (N, 3) array of targets, such as the waypoints of a path.
+
+    All targets are solved in closed form at once. Only the ones that are out of reach are then
+    refined one by one with the optimizer, in a pool of worker processes if there are at least
+    _POOL_MIN_TARGETS of them and more than one worker.
+
+    Returns an (N, 3) array of motor settings in the same order as targets, and an array of N
+    residual errors.
+    """
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 3)
+    angles, errs = get_motor_settings_analytic_batch(targets)
+    inexact = np.flatnonzero(errs >= _ANALYTIC_TOLERANCE)
+    if len(inexact) == 0:
+        return angles, errs
+
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers <= 1 or len(inexact) < _POOL_MIN_TARGETS:
+        angles[inexact], errs[inexact] = _refine(targets[inexact], angles[inexact])
+        return angles, errs
+
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(inexact) // workers))
+    chunks = [inexact[i : i + chunk_size] for i in range(0, len(inexact), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_refine, [targets[c] for c in chunks], [angles[c] for c in chunks])
+        for chunk, (chunk_angles, chunk_errs) in zip(chunks, results):
+            angles[chunk] = chunk_angles
+            errs[chunk] = chunk_errs
+    return angles, errs
+
+
+class IKCache:
+    """A bounded LRU cache in front of get_motor_settings.
+
+    Targets are quantized to a grid with the given resolution, so nearby targets share
+    an entry, as long as they are solved with the same method. A hit returns the motor
+    settings solved for the first target that landed in the same cell, which can be up to
+    half a cell off in each axis. The residual error is recomputed for the actual target,
+    and a hit is a success if the cached solution succeeded and the residual is at most
+    tolerance more than the cached solution's own. Like the grid backend's tolerance, the
+    default is well within the slop of the arm, and above the cell diagonal of the default
+    resolution.
+
+    The key ignores initial_guess, so a hit may return a different branch than a solve
+    warm started from initial_guess would. At full stick, the virtual point moves about
+    0.083 per frame (5 units/s at 60 frames/s), which is more than the default resolution,
+    so the cache mostly hits while the stick is held still.
+    """
+
+    def __init__(self, capacity: int = 256, resolution: float = 0.05, tolerance: float = 0.1):
+        self.capacity = capacity
+        self.resolution = resolution
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple[str, tuple[int, ...]], OptimizeResult] = OrderedDict()
 
+    def __len__(self):
+        return len(self._entries)
 
+    def _key(self, target: Vec3, method: str) -> tuple[str, tuple[int, ...]]:
+        return method, tuple(np.round(np.asarray(target) / self.resolution).astype(int).tolist())
 
+    def get_motor_settings(
+        self,
+        target: Vec3,
+        initial_guess: npt.ArrayLike | None = None,
+        method: Literal["auto", "analytic", "slsqp", "grid"] = "auto",
+    ) -> OptimizeResult:
+        key = self._key(target, method)
+        sol = self._entries.get(key)
+        hit = sol is not None
+        if hit:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            sol = get_motor_settings(target, initial_guess, method)
+            self._entries[key] = sol
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        # Callers are free to modify the result, so hand out a copy.
+        ret = OptimizeResult(sol)
+        ret.x = sol.x.copy()
+        if hit:
+            ret.fun = get_err(ret.x, target)
+            ret.success = bool(sol.success and ret.fun <= sol.fun + self.tolerance)
+            if sol.success and not ret.success:
+                ret.message = "cached solution misses target"
+        return ret
 
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,183 @@
+#! /usr/bin/env python3
+
+"""Micro-benchmarks for the kinematics module.
+
+Runs a fixed set of random targets and a regular grid of targets through get_pos, get_err
+and every get_motor_settings backend, and reports latency percentiles, solver iterations
+and residual error. Results are printed and written as JSON so runs can be compared:
+
+    ./kinematics_benchmark.py --output bench.json
+
+Nothing here needs the brick or a joystick.
+"""
+
+import argparse
+import json
+import platform
+import time
+from math import radians
+from typing import Any, Callable
+import numpy as np
+
+import kinematics
+
+_METHODS = ("auto", "analytic", "slsqp", "grid")
+
+
+def random_targets(n: int, seed: int = 0) -> np.ndarray:
+    """n reachable targets, from motor settings drawn uniformly within the joint bounds."""
+    rng = np.random.default_rng(seed)
+    return kinematics.get_pos_batch(rng.uniform(kinematics._LOWER_BOUNDS, kinematics._UPPER_BOUNDS, (n, 3)))
+
+
+def grid_targets(per_axis: int) -> np.ndarray:
+    """A per_axis^3 grid over the box around the arm, including unreachable targets."""
+    reach = kinematics.get_reach()
+    axis = np.linspace(-reach, reach, per_axis)
+    return np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def _summarize(latencies_ns: list[int], extra: dict[str, Any] | None = None) -> dict[str, Any]:
+    us = np.array(latencies_ns) / 1000
+    summary = {
+        "count": len(us),
+        "p50_us": float(np.percentile(us, 50)),
+        "p95_us": float(np.percentile(us, 95)),
+        "p99_us": float(np.percentile(us, 99)),
+        "max_us": float(us.max()),
+    }
+    summary.update(extra or {})
+    return summary
+
+
+def _time_each(f: Callable[[Any], Any], inputs) -> tuple[list[int], list[Any]]:
+    latencies = []
+    results = []
+    for input in inputs:
+        start = time.perf_counter_ns()
+        result = f(input)
+        latencies.append(time.perf_counter_ns() - start)
+        results.append(result)
+    return latencies, results
+
+
+def bench_forward(targets: np.ndarray) -> dict[str, Any]:
+    angles = [kinematics.get_motor_settings_analytic(t).x for t in targets]
+    pos_latencies, _ = _time_each(kinematics.get_pos, angles)
+    err_latencies, _ = _time_each(lambda a: kinematics.get_err(a, targets[0]), angles)
+    start = time.perf_counter_ns()
+    kinematics.get_pos_batch(angles)
+    batch_ns = time.perf_counter_ns() - start
+    return {
+        "get_pos": _summarize(pos_latencies),
+        "get_err": _summarize(err_latencies),
+        "get_pos_batch": {"count": len(angles), "total_us": batch_ns / 1000},
+    }
+
+
+def _solver_summary(latencies: list[int], results: list[Any]) -> dict[str, Any]:
+    nit = np.array([r.nit for r in results])
+    fun = np.array([r.fun for r in results])
+    return _summarize(
+        latencies,
+        {
+            "mean_iterations": float(nit.mean()),
+            "max_iterations": int(nit.max()),
+            "success_rate": float(np.mean([r.success for r in results])),
+            "p50_residual": float(np.percentile(fun, 50)),
+            "p99_residual": float(np.percentile(fun, 99)),
+            "max_residual": float(fun.max()),
+        },
+    )
+
+
+def bench_solvers(targets: np.ndarray) -> dict[str, Any]:
+    ret = {}
+    for method in _METHODS:
+        # The first call may load a cache from disk, which is not what we're measuring.
+        kinematics.get_motor_settings(targets[0], method=method)
+        ret[method] = _solver_summary(*_time_each(lambda t: kinematics.get_motor_settings(t, method=method), targets))
+
+    # The incremental solver is meant for targets that move smoothly, so walk the targets
+    # in order, each warm started from the previous solution.
+    previous = kinematics.get_motor_settings(targets[0]).x
+
+    def incremental(target):
+        nonlocal previous
+        sol = kinematics.get_motor_settings_incremental(target, previous)
+        previous = sol.x
+        return sol
+
+    ret["incremental"] = _solver_summary(*_time_each(incremental, targets))
+    return ret
+
+
+def smooth_path(n: int) -> np.ndarray:
+    """n targets along a slow sweep through the workspace, like a joystick held steady."""
+    t = np.linspace(0, 1, n)[:, np.newaxis]
+    start = np.array((radians(-60), radians(30), radians(30)))
+    end = np.array((radians(60), radians(70), radians(100)))
+    return kinematics.get_pos_batch(start + t * (end - start))
+
+
+def run(n_random: int, grid_per_axis: int, n_path: int, seed: int) -> dict[str, Any]:
+    random = random_targets(n_random, seed)
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "forward": bench_forward(random),
+        "random": bench_solvers(random),
+        "grid": bench_solvers(grid_targets(grid_per_axis)),
+        "path": bench_solvers(smooth_path(n_path)),
+    }
+
+
+def _print_report(report: dict[str, Any]):
+    forward = report["forward"]
+    for name in ("get_pos", "get_err"):
+        stats = forward[name]
+        print(
+            "{:<14} p50 {:8.1f}us  p95 {:8.1f}us  p99 {:8.1f}us  max {:8.1f}us".format(
+                name, stats["p50_us"], stats["p95_us"], stats["p99_us"], stats["max_us"]
+            )
+        )
+    batch = forward["get_pos_batch"]
+    print("{:<14} {:8.1f}us for {} positions".format("get_pos_batch", batch["total_us"], batch["count"]))
+    for target_set in ("random", "grid", "path"):
+        print(target_set)
+        for method, stats in report[target_set].items():
+            print(
+                "  {:<12} p50 {:8.1f}us  p95 {:8.1f}us  p99 {:8.1f}us  max {:8.1f}us  "
+                "iters {:5.1f}  ok {:5.1%}  max residual {:.3g}".format(
+                    method,
+                    stats["p50_us"],
+                    stats["p95_us"],
+                    stats["p99_us"],
+                    stats["max_us"],
+                    stats["mean_iterations"],
+                    stats["success_rate"],
+                    stats["max_residual"],
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--random", type=int, default=500, help="number of random targets")
+    parser.add_argument("--grid", type=int, default=8, help="grid targets per axis")
+    parser.add_argument("--path", type=int, default=500, help="number of targets along a smooth path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the JSON report to")
+    args = parser.parse_args()
+
+    report = run(args.random, args.grid, args.path, args.seed)
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
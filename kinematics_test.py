@@ -1,7 +1,12 @@
 #! /usr/bin/env python3
 
+import math
 import unittest
-from kinematics import get_pos, get_err, get_motor_settings
+import kinematics
+from kinematics import get_pos, get_err, get_motor_settings, get_jacobian, get_err_grad
+from kinematics import get_radius, get_pos_batch, get_err_batch, get_radius_batch, ik_step, IKCache
+from kinematics import get_motor_settings_incremental, solve_many
+import numpy as np
 from math import sin, cos, radians
 import numpy.testing as npt
 
@@ -46,6 +51,204 @@ class TestGetPos(unittest.TestCase):
         # in the motors and gearing.
         npt.assert_allclose(get_motor_settings(output_pos).x, input, rtol=1, atol=radians(1))
 
+    def test_minimize_slsqp(self):
+        input = (radians(45), radians(45), 0)
+        output_pos = get_pos(input)
+        npt.assert_allclose(get_motor_settings(output_pos, method="slsqp").x, input, rtol=1, atol=radians(1))
+
+
+class TestAnalytic(unittest.TestCase):
+    def test_round_trip(self):
+        # Every configuration within the bounds should be recovered exactly.
+        for input in [(0, radians(17), radians(-6)), (radians(-80), radians(60), radians(120)), (radians(30), radians(89), radians(160))]:
+            sol = get_motor_settings(get_pos(input), method="analytic")
+            self.assertTrue(sol.success)
+            self.assertAlmostEqual(sol.fun, 0)
+            npt.assert_allclose(sol.x, input, atol=1e-9)
+
+    def test_unreachable_is_clamped(self):
+        # Far out of reach: the arm should stretch straight toward the target.
+        sol = get_motor_settings(np.array((100.0, 0.0, 0.0)), method="analytic")
+        self.assertFalse(sol.success)
+        npt.assert_allclose(sol.fun, get_err(sol.x, np.array((100.0, 0.0, 0.0))))
+        self.assertGreater(sol.fun, 60)
+
+    def test_ik_step_converges(self):
+        input = np.array((radians(30), radians(50), radians(40)))
+        target = get_pos(input + radians(2))
+        step = ik_step(input, target)
+        self.assertLess(get_err(step, target), get_err(input, target) / 10)
+
+    def test_incremental(self):
+        previous = np.array((radians(30), radians(50), radians(40)))
+        target = get_pos(previous + radians(0.5))
+        sol = get_motor_settings_incremental(target, previous)
+        self.assertEqual(sol.nit, 1)
+        self.assertLess(sol.fun, 0.05)
+
+    def test_incremental_falls_back(self):
+        previous = np.array((radians(-80), radians(20), radians(0)))
+        target = get_pos((radians(80), radians(80), radians(120)))
+        sol = get_motor_settings_incremental(target, previous)
+        self.assertTrue(sol.success)
+        self.assertAlmostEqual(sol.fun, 0)
+
+    def test_auto_not_worse_than_analytic(self):
+        target = np.array((-10.0, 30.0, -12.0))
+        self.assertLessEqual(get_motor_settings(target).fun, get_motor_settings(target, method="analytic").fun)
+
+
+class TestDerivatives(unittest.TestCase):
+    _INPUTS = [(0, radians(45), 0), (radians(-60), radians(20), radians(150)), (radians(80), radians(88), radians(-5))]
+
+    @staticmethod
+    def _finite_difference(f, input, h=1e-6):
+        input = np.array(input, dtype=float)
+        columns = []
+        for i in range(len(input)):
+            step = np.zeros(len(input))
+            step[i] = h
+            columns.append((np.asarray(f(input + step)) - np.asarray(f(input - step))) / (2 * h))
+        return np.stack(columns, axis=-1)
+
+    def test_jacobian(self):
+        for input in self._INPUTS:
+            npt.assert_allclose(get_jacobian(input), self._finite_difference(get_pos, input), atol=1e-6)
+
+    def test_err_grad(self):
+        target = np.array((10.0, 20.0, -5.0))
+        for input in self._INPUTS:
+            npt.assert_allclose(
+                get_err_grad(input, target),
+                self._finite_difference(lambda x: get_err(x, target), input),
+                atol=1e-6,
+            )
+
+    def test_err_grad_at_target(self):
+        input = (radians(45), radians(45), 0)
+        npt.assert_allclose(get_err_grad(input, get_pos(input)), (0, 0, 0))
+
+def reference_radius(angles):
+    """get_radius written out with math, independently of kinematics."""
+    return 2.0 + 20.0 * math.sin(angles[1]) + 15.0 * math.sin(angles[1] + angles[2])
+
+
+def reference_pos(angles):
+    r = reference_radius(angles)
+    return (
+        r * math.cos(angles[0]),
+        20.0 * math.cos(angles[1]) + 15.0 * math.cos(angles[1] + angles[2]),
+        r * math.sin(angles[0]),
+    )
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.angles = rng.uniform((radians(-90), radians(17), radians(-6)), (radians(90), radians(90), radians(161)), (50, 3))
+
+    def test_pos_matches_reference(self):
+        batch = get_pos_batch(self.angles)
+        self.assertEqual(batch.shape, (50, 3))
+        for angles, pos in zip(self.angles, batch):
+            npt.assert_allclose(pos, reference_pos(angles), rtol=1e-12, atol=1e-12)
+            npt.assert_allclose(get_pos(angles), reference_pos(angles), rtol=1e-12, atol=1e-12)
+
+    def test_radius_matches_reference(self):
+        batch = get_radius_batch(self.angles)
+        for angles, r in zip(self.angles, batch):
+            self.assertAlmostEqual(r, reference_radius(angles), places=12)
+            self.assertAlmostEqual(get_radius(angles), reference_radius(angles), places=12)
+
+    def test_err_matches_reference(self):
+        target = np.array((10.0, 20.0, -5.0))
+        batch = get_err_batch(self.angles, target)
+        self.assertEqual(batch.shape, (50,))
+        for angles, err in zip(self.angles, batch):
+            expected = math.dist(target, reference_pos(angles))
+            self.assertAlmostEqual(err, expected, places=12)
+            self.assertAlmostEqual(get_err(angles, target), expected, places=12)
+
+    def test_err_per_row_targets(self):
+        npt.assert_allclose(get_err_batch(self.angles, get_pos_batch(self.angles)), np.zeros(50))
+
+class TestSolveMany(unittest.TestCase):
+    def setUp(self):
+        t = np.linspace(0, 1, 40)[:, np.newaxis]
+        self.angles = np.array((radians(-60), radians(30), radians(30))) + t * np.array((radians(120), radians(40), radians(70)))
+        self.targets = get_pos_batch(self.angles)
+
+    def test_exact(self):
+        angles, errs = solve_many(self.targets, workers=1)
+        self.assertEqual(angles.shape, (40, 3))
+        npt.assert_allclose(get_pos_batch(angles), self.targets, atol=1e-6)
+        npt.assert_allclose(errs, get_err_batch(angles, self.targets))
+
+    def test_out_of_reach_matches_auto(self):
+        targets = np.concatenate((self.targets, [(50.0, 0.0, 0.0), (0.0, 0.0, 0.0)]))
+        angles, errs = solve_many(targets, workers=1)
+        for target, err in zip(targets[-2:], errs[-2:]):
+            self.assertAlmostEqual(err, get_motor_settings(target).fun, places=4)
+
+    def test_pool_matches_order(self):
+        rng = np.random.default_rng(2)
+        targets = np.concatenate((self.targets, rng.uniform(40, 60, (kinematics._POOL_MIN_TARGETS, 3))))
+        serial = solve_many(targets, workers=1)
+        pooled = solve_many(targets, workers=2, chunk_size=70)
+        npt.assert_allclose(pooled[0], serial[0])
+        npt.assert_allclose(pooled[1], serial[1])
+
+
+class TestIKCache(unittest.TestCase):
+    def test_hit_within_resolution(self):
+        cache = IKCache(resolution=0.05)
+        target = np.array((20.0, 10.0, 5.0))
+        first = cache.get_motor_settings(target)
+        second = cache.get_motor_settings(target + 0.01)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        npt.assert_array_equal(first.x, second.x)
+        self.assertAlmostEqual(second.fun, get_err(second.x, target + 0.01))
+        self.assertTrue(first.success)
+        self.assertTrue(second.success)
+
+    def test_hit_beyond_tolerance_fails(self):
+        cache = IKCache(resolution=0.05, tolerance=0.001)
+        target = np.array((20.0, 10.0, 5.0))
+        cache.get_motor_settings(target)
+        sol = cache.get_motor_settings(target + 0.02)
+        self.assertEqual(cache.hits, 1)
+        self.assertFalse(sol.success)
+        self.assertEqual(sol.message, "cached solution misses target")
+
+    def test_exact_hit_succeeds(self):
+        cache = IKCache()
+        target = get_pos((radians(10), radians(45), radians(30)))
+        cache.get_motor_settings(target)
+        sol = cache.get_motor_settings(target)
+        self.assertEqual(cache.hits, 1)
+        self.assertTrue(sol.success)
+
+    def test_method_is_part_of_key(self):
+        cache = IKCache()
+        target = get_pos((radians(10), radians(45), radians(30)))
+        cache.get_motor_settings(target, method="analytic")
+        sol = cache.get_motor_settings(target, method="slsqp")
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertNotEqual(sol.message, "exact solution")
+
+    def test_results_are_copies(self):
+        cache = IKCache()
+        target = get_pos((radians(10), radians(45), radians(30)))
+        cache.get_motor_settings(target).x[:] = 0
+        self.assertGreater(cache.get_motor_settings(target).x[1], 0)
+
+    def test_eviction(self):
+        cache = IKCache(capacity=2, resolution=1)
+        for target in [(20, 10, 0), (21, 10, 0), (20, 10, 0), (22, 10, 0), (21, 10, 0)]:
+            cache.get_motor_settings(np.array(target, dtype=float))
+        # (21, 10, 0) was the least recently used entry when (22, 10, 0) came in.
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 4, 2))
+        self.assertEqual(len(cache), 2)
 
 
 if __name__ == '__main__':
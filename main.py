@@ -21,6 +21,7 @@ from micropython import const
 import ustruct
 from typing import *
 import _thread
+import event_log
 import net_formats
 
 brick = EV3Brick()
@@ -133,7 +134,7 @@ def send_motor(
     actual_speed = max(ideal_speed, min_speed)
     if m.angle() - actual_target == 0 or actual_speed < 0.05:
         return
-    print(actual_speed, m.angle(), actual_target)
+    event_log.log.info(event_log.MOTOR_RUN, actual_speed, m.angle(), actual_target)
     m.run_target(actual_speed, actual_target, wait=False)
 
 
@@ -224,7 +225,7 @@ def serve():
                     arm1_target,
                     arm2_target,
                 ) = ustruct.unpack_from(net_formats.target_format, mailbox.read())
-                print('Got new target: in ', time_to_target, 'ms: ', turntable_target, arm1_target, arm2_target)
+                event_log.log.info(event_log.TARGET_RECEIVED, time_to_target, turntable_target, arm1_target, arm2_target)
 
                 send_turntable(turntable_target, time_to_target)
                 send_arm1(arm1_target, time_to_target)
@@ -248,4 +249,6 @@ while True:
         print(e)
     finally:
         print('server loop exitted, restarting')
+        # Decode on the PC with ./event_log.py events.bin.
+        event_log.log.dump_to('events.bin')
         wait(5000)
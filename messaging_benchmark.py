@@ -0,0 +1,267 @@
+#! /usr/bin/env python3
+
+"""Micro-benchmarks for the mailbox protocol in pybrickspc.messaging.
+
+Feeds a stream of target_position frames through MailboxHandler, and through a copy of the
+original handler for comparison. Then sends target_position values with send_to_mailbox, and
+with the original send_to_mailbox for comparison. No socket is involved, so this only measures
+the parsing and encoding.
+
+For each, reports the best time per message over a few runs, and the memory each message
+leaves allocated: what is still allocated after N messages, divided by N, with every received
+payload (or every frame handed to the client) kept alive. tracemalloc can only see what is
+still allocated, so temporaries freed within a message are not counted. Keeping the messages
+costs a list slot each, about 8 bytes.
+
+Parsing frames in place does not make receiving measurably faster on CPython: most of the time
+per message goes to storing the payload and waking waiters, which both handlers do, and both
+copy each payload into a new bytes object.
+
+    ./messaging_benchmark.py --messages 20000 --output bench.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import struct
+import time
+import tracemalloc
+from errno import ECONNRESET
+from socketserver import StreamRequestHandler
+from struct import pack, unpack
+from typing import Any
+
+import net_formats
+from pybrickspc.messaging import SYSTEM_COMMAND_NO_REPLY, WRITEMAILBOX, MailboxHandler, MailboxHandlerMixIn
+
+
+class ReferenceMailboxHandler(StreamRequestHandler):
+    """MailboxHandler as it was before frames were parsed in place."""
+
+    def handle(self):
+        with self.server._lock:
+            self.server._clients[self.client_address[0]] = self.request
+        while True:
+            try:
+                buf = self.rfile.read(2)
+                if len(buf) == 0:
+                    break
+            except OSError as ex:
+                if ex.args[0] == ECONNRESET:
+                    break
+                raise
+            (size,) = unpack("<H", buf)
+            buf = self.rfile.read(size)
+            msg_count, cmd_type, cmd, name_size = unpack("<HBBB", buf[0:5])
+            if cmd_type != SYSTEM_COMMAND_NO_REPLY:
+                raise ValueError("Bad message type")
+            if cmd != WRITEMAILBOX:
+                raise ValueError("Bad command")
+            mbox = buf[5 : 5 + name_size].decode().strip("\0")
+            (data_size,) = unpack("<H", buf[5 + name_size : 7 + name_size])
+            data = buf[7 + name_size : 7 + name_size + data_size]
+
+            # Notify waiters the way the current handler does.
+            with self.server._update_cond:
+                self.server._mailboxes[mbox] = data
+                self.server._seqs[mbox] = self.server._seqs.get(mbox, 0) + 1
+                self.server._update_cond.notify_all()
+
+
+def encode_frame(mbox: str, payload: bytes) -> bytes:
+    """A frame as the original send_to_mailbox built it, every time."""
+    mbox_len = len(mbox) + 1
+    payload_len = len(payload)
+    fmt = "<HHBBB{}sH{}s".format(mbox_len, payload_len)
+    return pack(
+        fmt,
+        7 + mbox_len + payload_len,
+        1,
+        SYSTEM_COMMAND_NO_REPLY,
+        WRITEMAILBOX,
+        mbox_len,
+        mbox.encode("utf-8"),
+        payload_len,
+        payload,
+    )
+
+
+def reference_send_to_mailbox(server: MailboxHandlerMixIn, brick: str | None, mbox: str, payload: bytes):
+    """MailboxHandlerMixIn.send_to_mailbox as it was before frame encoders were cached."""
+    data = encode_frame(mbox, payload)
+    with server._lock:
+        if brick is None:
+            for client in server._clients.values():
+                client.send(data)
+        else:
+            server._clients[brick].send(data)
+
+
+def target_stream(n: int) -> bytes:
+    return b"".join(
+        encode_frame(net_formats.target_channel, struct.pack(net_formats.target_format, 33, i % 90, 50, 10))
+        for i in range(n)
+    )
+
+
+class _Server(MailboxHandlerMixIn):
+    pass
+
+
+class _Request:
+    def __init__(self, reader: io.BufferedReader):
+        self._reader = reader
+
+    def makefile(self, mode, bufsize=None):
+        return self._reader
+
+
+def _parse(handler_class, reader: io.BufferedReader, server: _Server):
+    handler_class(_Request(reader), ("benchmark", 0), server)
+
+
+class _KeepAll(dict):
+    """A mailbox dict that also keeps every value ever stored in it."""
+
+    def __init__(self):
+        super().__init__()
+        self.kept: list[Any] = []
+
+    def __setitem__(self, key, value):
+        self.kept.append(value)
+        super().__setitem__(key, value)
+
+
+def _allocated_per_message(run, messages: int) -> dict[str, float]:
+    """What run() leaves allocated, per message. run should handle or send messages messages."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        run()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),)).compare_to(
+        before.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),)), "filename"
+    )
+    return {
+        "bytes_per_message": sum(stat.size_diff for stat in stats) / messages,
+        "blocks_per_message": sum(stat.count_diff for stat in stats) / messages,
+    }
+
+
+_RUNS = 5
+
+
+def bench_receive(handler_class, messages: int) -> dict[str, Any]:
+    data = target_stream(messages)
+    best = None
+    for _ in range(_RUNS):
+        server = _Server()
+        start = time.perf_counter_ns()
+        _parse(handler_class, io.BufferedReader(io.BytesIO(data)), server)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    server = _Server()
+    # Learn the mailbox name first, as a long running connection would have.
+    _parse(handler_class, io.BufferedReader(io.BytesIO(data[: len(data) // messages])), server)
+    server._mailboxes = _KeepAll()
+    reader = io.BufferedReader(io.BytesIO(data))
+    allocated = _allocated_per_message(lambda: _parse(handler_class, reader, server), messages)
+    return {"messages": messages, "us_per_message": best / messages / 1000, **allocated}
+
+
+class _NullClient:
+    def send(self, data):
+        pass
+
+    sendall = send
+
+
+class _KeepingClient:
+    def __init__(self):
+        self.kept: list[Any] = []
+
+    def send(self, data):
+        self.kept.append(data)
+
+    sendall = send
+
+
+def bench_send(send, messages: int) -> dict[str, Any]:
+    """Times send(server, i) for each message. send should send a target_position to the
+    server's clients."""
+    server = _Server()
+    server._clients["benchmark"] = _NullClient()
+    send(server, 0)
+    best = None
+    for _ in range(_RUNS):
+        start = time.perf_counter_ns()
+        for i in range(messages):
+            send(server, i)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    server._clients["benchmark"] = _KeepingClient()
+
+    def run():
+        for i in range(messages):
+            send(server, i)
+
+    return {"messages": messages, "us_per_message": best / messages / 1000, **_allocated_per_message(run, messages)}
+
+
+def _senders():
+    channel = net_formats.target_channel
+    target = struct.Struct(net_formats.target_format)
+
+    def reference(server, i):
+        reference_send_to_mailbox(server, None, channel, target.pack(33, i % 90, 50, 10))
+
+    def current(server, i):
+        server.send_to_mailbox(None, channel, target.pack(33, i % 90, 50, 10))
+
+    return {"reference": reference, "current": current}
+
+
+def run(messages: int) -> dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "receive": {
+            "reference": bench_receive(ReferenceMailboxHandler, messages),
+            "current": bench_receive(MailboxHandler, messages),
+        },
+        "send": {name: bench_send(send, messages) for name, send in _senders().items()},
+    }
+
+
+def _print_report(report: dict[str, Any]):
+    for section in ("receive", "send"):
+        print(section)
+        for name, r in report[section].items():
+            print(
+                "  {:10} {:8.3f} us/message {:8.1f} bytes/message {:6.2f} blocks/message".format(
+                    name, r["us_per_message"], r["bytes_per_message"], r["blocks_per_message"]
+                )
+            )
+        ratio = report[section]["current"]["us_per_message"] / report[section]["reference"]["us_per_message"]
+        print("  current takes {:.0%} of the reference time".format(ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--output", help="file to write the JSON report to")
+    args = parser.parse_args()
+
+    report = run(args.messages)
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
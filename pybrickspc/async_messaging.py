@@ -0,0 +1,333 @@
+#! /usr/bin/env python3
+
+"""
+:class:`AsyncMailboxServer` and :class:`AsyncMailboxClient` speak the same
+mailbox protocol as :mod:`pybrickspc.messaging`, on asyncio streams instead
+of ``socketserver`` threads, so they can share an event loop with the rest of
+a program. Use them with :class:`AsyncMailbox`::
+
+    async with AsyncMailboxClient() as client:
+        await client.connect(("localhost", 5000))
+        position = AsyncMailbox("current_position", client)
+        async for value in position:
+            ...
+
+Like the threaded classes, they connect over Bluetooth RFCOMM given a
+Bluetooth address, or over TCP given a ``(host, port)`` tuple.
+"""
+
+import asyncio
+import sys
+import traceback
+from socket import socket, SOCK_STREAM
+from sys import intern
+
+from pybrickspc.bluetooth import AF_BLUETOOTH, BTPROTO_RFCOMM
+from pybrickspc.messaging import (
+    BDADDR_ANY,
+    EV3_RFCOMM_CHANNEL,
+    FRAME_HEADER,
+    PAYLOAD_SIZE,
+    SYSTEM_COMMAND_NO_REPLY,
+    WRITEMAILBOX,
+    FrameEncoder,
+    Mailbox,
+    resolve,
+)
+
+
+class AsyncMailbox(Mailbox):
+    """:class:`Mailbox` for an :class:`AsyncMailboxServer` or
+    :class:`AsyncMailboxClient`. Reading, sending and waiting are coroutines.
+    Iterating over it with ``async for`` yields every value it receives from
+    then on, except that a loop that falls more than
+    :attr:`AsyncMailboxHandlerMixIn.subscriber_queue_size` values behind
+    skips the oldest ones.
+    """
+
+    async def read(self):
+        """Reads the current value of the mailbox. See :meth:`Mailbox.read`."""
+        return super().read()
+
+    async def read_with_seq(self):
+        """See :meth:`Mailbox.read_with_seq`."""
+        return super().read_with_seq()
+
+    async def send(self, value, destination=None):
+        """Sends a value, waiting until it can be written. See
+        :meth:`Mailbox.send`."""
+        await self._connection.send_to_mailbox(destination, self.name, self.encode(value))
+
+    async def wait(self, timeout=None):
+        """See :meth:`Mailbox.wait`."""
+        return await self._connection.wait_for_mailbox_update(self.name, timeout)
+
+    async def wait_for_seq(self, seq, timeout=None):
+        """See :meth:`Mailbox.wait_for_seq`."""
+        return await self._connection.wait_for_mailbox_seq(self.name, seq, timeout)
+
+    async def wait_new(self, timeout=None):
+        """See :meth:`Mailbox.wait_new`."""
+        if not await self.wait_for_seq(self.seq + 1, timeout):
+            return None
+        return await self.read()
+
+    async def __aiter__(self):
+        queue = self._connection._subscribe(self.name)
+        try:
+            while True:
+                yield self.decode(await queue.get())
+        finally:
+            self._connection._unsubscribe(self.name, queue)
+
+
+class AsyncMailboxHandlerMixIn:
+    subscriber_queue_size = 16
+    """The number of values kept for each ``async for`` loop over a mailbox
+    that hasn't taken them yet."""
+
+    def __init__(self):
+        # map of mailbox name to raw data
+        self._mailboxes = {}
+        # map of mailbox name to the number of messages received, notified
+        # through _update when it changes
+        self._seqs = {}
+        self._update = asyncio.Condition()
+        # map of mailbox name to the queues of its async iterators
+        self._subscribers = {}
+        # map of device address to StreamWriter
+        self._clients = {}
+        # map of names to addresses
+        self._addresses = {}
+        # map of mailbox name to map of payload size to FrameEncoder
+        self._encoders = {}
+        # map of raw mailbox name to name
+        self._names = {}
+        self._tasks = set()
+
+    async def _handle(self, reader, writer, addr):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                size, msg_count, cmd_type, cmd, name_size = FRAME_HEADER.unpack(header)
+                if cmd_type != SYSTEM_COMMAND_NO_REPLY:
+                    raise ValueError("Bad message type")
+                if cmd != WRITEMAILBOX:
+                    raise ValueError("Bad command")
+                # size counts the header after itself.
+                body = await reader.readexactly(size + 2 - FRAME_HEADER.size)
+                raw_name = body[:name_size]
+                mbox = self._names.get(raw_name)
+                if mbox is None:
+                    mbox = self._names[raw_name] = intern(raw_name.decode().strip("\0"))
+                (data_size,) = PAYLOAD_SIZE.unpack_from(body, name_size)
+                data = body[name_size + 2 : name_size + 2 + data_size]
+
+                self._mailboxes[mbox] = data
+                self._seqs[mbox] = self._seqs.get(mbox, 0) + 1
+                for queue in self._subscribers.get(mbox, ()):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(data)
+                async with self._update:
+                    self._update.notify_all()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            # The client disconnected the connection
+            pass
+        except Exception:
+            # Nothing awaits this task, so report it like socketserver does.
+            print("Exception occurred during processing of frames from", addr, file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            if self._clients.get(addr) is writer:
+                del self._clients[addr]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    def _start(self, reader, writer, addr):
+        self._clients[addr] = writer
+        task = asyncio.create_task(self._handle(reader, writer, addr))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _subscribe(self, mbox):
+        queue = asyncio.Queue(self.subscriber_queue_size)
+        self._subscribers.setdefault(mbox, []).append(queue)
+        return queue
+
+    def _unsubscribe(self, mbox, queue):
+        self._subscribers[mbox].remove(queue)
+
+    def read_from_mailbox(self, mbox):
+        """Reads the current raw data from a mailbox. See
+        :meth:`MailboxHandlerMixIn.read_from_mailbox`."""
+        return self._mailboxes.get(mbox)
+
+    def read_from_mailbox_with_seq(self, mbox):
+        """See :meth:`MailboxHandlerMixIn.read_from_mailbox_with_seq`."""
+        return self._mailboxes.get(mbox), self._seqs.get(mbox, 0)
+
+    def mailbox_seq(self, mbox):
+        """The number of values ``mbox`` has received."""
+        return self._seqs.get(mbox, 0)
+
+    async def send_to_mailbox(self, brick, mbox, payload):
+        """Sends a mailbox value using raw bytes data, and waits until it
+        can be written. See :meth:`MailboxHandlerMixIn.send_to_mailbox`.
+        """
+        encoders = self._encoders.setdefault(mbox, {})
+        encoder = encoders.get(len(payload))
+        if encoder is None:
+            encoder = encoders[len(payload)] = FrameEncoder(mbox, len(payload))
+        # The transport may hold on to what it is given, and the encoder's
+        # frame is reused, so it has to be copied.
+        data = bytes(encoder.encode(payload))
+        if brick is None:
+            writers = list(self._clients.values())
+        else:
+            addr = self._addresses.get(brick)
+            if addr is None:
+                addr = resolve(brick)
+                self._addresses[brick] = addr
+            if addr is None:
+                raise ValueError('no paired devices matching "{}"'.format(brick))
+            writers = [self._clients[addr]]
+        for writer in writers:
+            writer.write(data)
+        for writer in writers:
+            await writer.drain()
+
+    async def wait_for_mailbox_update(self, mbox, timeout=None):
+        """Waits until ``mbox`` receives a value.
+
+        Returns:
+            bool: ``False`` if ``timeout`` seconds passed first.
+        """
+        return await self.wait_for_mailbox_seq(mbox, self._seqs.get(mbox, 0) + 1, timeout)
+
+    async def wait_for_mailbox_seq(self, mbox, seq, timeout=None):
+        """Waits until ``mbox`` has received ``seq`` values in total.
+
+        Returns:
+            bool: ``False`` if ``timeout`` seconds passed first.
+        """
+        async with self._update:
+            try:
+                await asyncio.wait_for(self._update.wait_for(lambda: self._seqs.get(mbox, 0) >= seq), timeout)
+            except asyncio.TimeoutError:
+                return False
+            return True
+
+    async def close(self):
+        """Closes the connections."""
+        writers = list(self._clients.values())
+        for writer in writers:
+            writer.close()
+        self._clients.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *(writer.wait_closed() for writer in writers), return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+
+class AsyncMailboxServer(AsyncMailboxHandlerMixIn):
+    """Object that accepts mailbox connections on an event loop, over
+    Bluetooth or TCP.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._server = None
+        self._connected = asyncio.Condition()
+        self._connections = 0
+
+    async def _accept(self, reader, writer):
+        self._start(reader, writer, writer.get_extra_info("peername")[0])
+        async with self._connected:
+            self._connections += 1
+            self._connected.notify_all()
+
+    async def start(self, address=None):
+        """Starts listening.
+
+        Arguments:
+            address (tuple):
+                The (host, port) to listen on over TCP, where port 0 picks a
+                free port (see ``server_address``), or ``None`` to listen for
+                Bluetooth connections like :class:`BluetoothMailboxServer`.
+        """
+        if address is None:
+            sock = socket(AF_BLUETOOTH, SOCK_STREAM, BTPROTO_RFCOMM)
+            sock.bind((BDADDR_ANY, EV3_RFCOMM_CHANNEL))
+            self._server = await asyncio.start_server(self._accept, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._accept, *address)
+
+    @property
+    def server_address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def wait_for_connection(self, count=1):
+        """Waits until ``count`` devices have connected since :meth:`start`."""
+        async with self._connected:
+            await self._connected.wait_for(lambda: self._connections >= count)
+
+    async def close(self):
+        """Stops listening and closes the connections."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await super().close()
+
+
+class AsyncMailboxClient(AsyncMailboxHandlerMixIn):
+    """Object that represents outgoing mailbox connections on an event loop,
+    over Bluetooth or TCP.
+    """
+
+    async def connect(self, brick):
+        """Connects to a mailbox server on another device.
+
+        Arguments:
+            brick (str or tuple):
+                The name or Bluetooth address of the remote EV3, or the
+                (host, port) of a TCP server.
+
+        Raises:
+            ValueError:
+                A connection to ``brick`` already exists.
+            OSError:
+                There was a problem establishing the connection.
+        """
+        if isinstance(brick, tuple):
+            addr = brick[0]
+            if addr in self._clients:
+                raise ValueError("connection with this address already exists")
+            reader, writer = await asyncio.open_connection(*brick)
+        else:
+            addr = resolve(brick)
+            if addr is None:
+                raise ValueError('no paired devices matching "{}"'.format(brick))
+            if addr in self._clients:
+                raise ValueError("connection with this address already exists")
+            sock = socket(AF_BLUETOOTH, SOCK_STREAM, BTPROTO_RFCOMM)
+            sock.setblocking(False)
+            try:
+                await asyncio.get_running_loop().sock_connect(sock, (addr, EV3_RFCOMM_CHANNEL))
+            except Exception:
+                sock.close()
+                raise
+            reader, writer = await asyncio.open_connection(sock=sock)
+        self._start(reader, writer, addr)
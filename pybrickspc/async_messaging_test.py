@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+import asyncio
+import contextlib
+import io
+import unittest
+
+from pybrickspc.async_messaging import AsyncMailbox, AsyncMailboxClient, AsyncMailboxServer
+from pybrickspc.messaging import FrameEncoder, Mailbox, NumericMailbox, TCPMailboxClient
+
+
+class TestLoopback(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = AsyncMailboxServer()
+        await self.server.start(("localhost", 0))
+        self.client = AsyncMailboxClient()
+        await self.client.connect(self.server.server_address)
+        await asyncio.wait_for(self.server.wait_for_connection(), 5)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_send_and_wait(self):
+        request = AsyncMailbox("request", self.server)
+        reply = AsyncMailbox("reply", self.client)
+        await AsyncMailbox("request", self.client).send(b"ping")
+        self.assertTrue(await request.wait_for_seq(1, timeout=5))
+        self.assertEqual(await request.read(), b"ping")
+
+        waiting = asyncio.create_task(reply.wait_new(timeout=5))
+        await asyncio.sleep(0)
+        await AsyncMailbox("reply", self.server).send(b"pong")
+        self.assertEqual(await waiting, b"pong")
+        self.assertEqual(await reply.read_with_seq(), (b"pong", 1))
+
+    async def test_timeout(self):
+        self.assertFalse(await AsyncMailbox("nothing", self.client).wait(timeout=0.01))
+        self.assertIsNone(await AsyncMailbox("nothing", self.client).wait_new(timeout=0.01))
+
+    async def test_iterate_every_update(self):
+        received = []
+
+        async def receive():
+            async for value in AsyncMailbox("count", self.server):
+                received.append(value)
+                if len(received) == 5:
+                    return
+
+        receiving = asyncio.create_task(receive())
+        await asyncio.sleep(0)
+        sender = AsyncMailbox("count", self.client)
+        for i in range(5):
+            await sender.send(bytes([i]))
+        await asyncio.wait_for(receiving, 5)
+        self.assertEqual(received, [bytes([i]) for i in range(5)])
+        self.assertEqual(self.server._subscribers["count"], [])
+
+    async def test_slow_iteration_skips_oldest(self):
+        self.server.subscriber_queue_size = 2
+        received = []
+        release = asyncio.Event()
+
+        async def receive():
+            async for value in AsyncMailbox("count", self.server):
+                received.append(value)
+                await release.wait()
+                if value == bytes([4]):
+                    return
+
+        receiving = asyncio.create_task(receive())
+        await asyncio.sleep(0)
+        sender = AsyncMailbox("count", self.client)
+        await sender.send(bytes([0]))
+        while not received:
+            await asyncio.sleep(0.01)
+        # The loop is busy with the first value while the rest arrive.
+        for i in range(1, 5):
+            await sender.send(bytes([i]))
+        self.assertTrue(await self.server.wait_for_mailbox_seq("count", 5, timeout=5))
+        release.set()
+        await asyncio.wait_for(receiving, 5)
+        self.assertEqual(received, [bytes([0]), bytes([3]), bytes([4])])
+
+    async def test_bad_frame_is_reported(self):
+        reader, writer = await asyncio.open_connection(*self.server.server_address)
+        await asyncio.wait_for(self.server.wait_for_connection(2), 5)
+        frame = bytearray(FrameEncoder("bad", 1).encode(b"x"))
+        frame[4] = 0  # command type
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            writer.write(frame)
+            # The server closes the connection.
+            self.assertEqual(await asyncio.wait_for(reader.read(), 5), b"")
+        writer.close()
+        await writer.wait_closed()
+        self.assertIn("ValueError: Bad message type", err.getvalue())
+
+    async def test_encoding(self):
+        numeric = NumericMailbox("number", None)
+        await AsyncMailbox("number", self.client, encode=numeric.encode).send(1.5)
+        number = AsyncMailbox("number", self.server, decode=numeric.decode)
+        self.assertTrue(await number.wait_for_seq(1, timeout=5))
+        self.assertEqual(await number.read(), 1.5)
+
+
+class TestSyncClient(unittest.IsolatedAsyncioTestCase):
+    async def test_sync_client(self):
+        server = AsyncMailboxServer()
+        await server.start(("localhost", 0))
+        loop = asyncio.get_running_loop()
+        client = TCPMailboxClient()
+        try:
+            await loop.run_in_executor(None, client.connect, server.server_address)
+            await asyncio.wait_for(server.wait_for_connection(), 5)
+
+            await loop.run_in_executor(None, Mailbox("up", client).send, b"hello")
+            self.assertEqual(await AsyncMailbox("up", server).wait_new(timeout=5), b"hello")
+
+            down = Mailbox("down", client)
+            waiting = loop.run_in_executor(None, down.wait_new, 5)
+            await asyncio.sleep(0.05)
+            await AsyncMailbox("down", server).send(b"world")
+            self.assertEqual(await waiting, b"world")
+        finally:
+            client.close()
+            await server.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
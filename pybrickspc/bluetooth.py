@@ -12,9 +12,16 @@ remain a strict subset of that implementation when it comes to low-level
 implementation details.
 """
 
-from socket import socket, AF_BLUETOOTH, BTPROTO_RFCOMM, SOCK_STREAM
+from socket import socket, SOCK_STREAM
 from socketserver import ThreadingMixIn
 
+try:
+    from socket import AF_BLUETOOTH, BTPROTO_RFCOMM
+except ImportError:
+    # Python builds without Bluetooth support (e.g. on macOS) can still use the TCP
+    # transport in pybrickspc.tcp.
+    AF_BLUETOOTH = BTPROTO_RFCOMM = None
+
 
 class RFCOMMServer:
     """
@@ -4,12 +4,19 @@
 # Copyright (C) 2020,2023 The Pybricks Authors
 
 from errno import ECONNRESET
-from struct import pack, unpack
-from socket import BDADDR_ANY
-from socketserver import StreamRequestHandler
-from threading import Lock
+from struct import Struct, pack, unpack
+from sys import intern
+try:
+    from socket import BDADDR_ANY
+except ImportError:
+    # See pybrickspc.bluetooth.
+    BDADDR_ANY = None
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Condition, Lock, Thread
+from time import monotonic
 
 from pybrickspc.bluetooth import ThreadingRFCOMMServer, ThreadingRFCOMMClient
+from pybrickspc.tcp import ThreadingTCPClient
 
 
 def resolve(brick):
@@ -75,23 +82,65 @@ class Mailbox:
         data = self.encode(value)
         self._connection.send_to_mailbox(destination, self.name, data)
 
-    def wait(self):
-        """Waits for the mailbox to receive a message."""
-        self._connection.wait_for_mailbox_update(self.name)
+    def read_with_seq(self):
+        """Reads the current value of the mailbox and its sequence number
+        together, see :attr:`seq`.
 
-    def wait_new(self):
-        """Waits for the mailbox to receive a message that is different from
-        the current contents of the mailbox.
+        Returns:
+            The decoded value or ``None``, and the sequence number.
+        """
+        data, seq = self._connection.read_from_mailbox_with_seq(self.name)
+        if data is None:
+            return None, seq
+        return self.decode(data), seq
+
+    @property
+    def seq(self):
+        """The number of messages the mailbox has received so far."""
+        return self._connection.mailbox_seq(self.name)
+
+    def wait(self, timeout=None):
+        """Waits for the mailbox to receive a message.
+
+        Arguments:
+            timeout (float): The most seconds to wait, or ``None`` to wait
+                for as long as it takes.
 
         Returns:
-            The new value. (Same as return value of :meth:`read`.)
+            ``False`` if the wait timed out, otherwise ``True``.
         """
-        old = self.read()
-        while True:
-            self.wait()
-            new = self.read()
-            if new != old:
-                return new
+        return self._connection.wait_for_mailbox_update(self.name, timeout)
+
+    def wait_for_seq(self, seq, timeout=None):
+        """Waits until the mailbox has received ``seq`` messages. Unlike
+        :meth:`wait`, this can't miss a message that arrives just before it
+        is called.
+
+        Arguments:
+            seq (int): The :attr:`seq` to wait for.
+            timeout (float): The most seconds to wait, or ``None`` to wait
+                for as long as it takes.
+
+        Returns:
+            ``False`` if the wait timed out, otherwise ``True``.
+        """
+        return self._connection.wait_for_mailbox_seq(self.name, seq, timeout)
+
+    def wait_new(self, timeout=None):
+        """Waits for the mailbox to receive a new message, even if it has
+        the same value as the current one.
+
+        Arguments:
+            timeout (float): The most seconds to wait, or ``None`` to wait
+                for as long as it takes.
+
+        Returns:
+            The new value (same as return value of :meth:`read`), or ``None``
+            if the wait timed out.
+        """
+        if not self.wait_for_seq(self.seq + 1, timeout):
+            return None
+        return self.read()
 
 
 class LogicMailbox(Mailbox):
@@ -144,36 +193,142 @@ SYSTEM_COMMAND_NO_REPLY = 0x81
 WRITEMAILBOX = 0x9E
 
 
+# Frame layout: the size of the rest of the frame, message counter, command type, command and
+# mailbox name size, then the name, then the payload size and payload. These and FrameEncoder
+# are shared with pybrickspc.async_messaging.
+FRAME_HEADER = Struct("<HHBBB")
+PAYLOAD_SIZE = Struct("<H")
+
+
 class MailboxHandler(StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self._set_buffer(256)
+        # Decoded mailbox names by name size, as (raw name, name) pairs, so that a name is
+        # only decoded the first time it arrives.
+        self._names = {}
+
+    def _set_buffer(self, size):
+        # Frames are read into this buffer, replaced by a bigger one when a frame doesn't fit.
+        self._buffer = bytearray(size)
+        self._header_view = memoryview(self._buffer)[: FRAME_HEADER.size]
+        # Slices of the buffer, by frame size and by payload start. Frames of the same
+        # mailbox have the same layout, so these are reused rather than sliced again.
+        self._body_views = {}
+        self._payload_views = {}
+
+    def _read_rest(self, view, filled):
+        """Finishes filling ``view`` after a short read of ``filled`` bytes.
+        Returns ``False`` if the connection was closed first."""
+        while filled < len(view):
+            n = self.rfile.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def _decode_name(self, name_size):
+        start = FRAME_HEADER.size
+        for raw, name in self._names.setdefault(name_size, []):
+            if self._buffer.startswith(raw, start):
+                return name
+        raw = bytes(self._buffer[start : start + name_size])
+        name = intern(raw.decode().strip("\0"))
+        self._names[name_size].append((raw, name))
+        return name
+
     def handle(self):
         with self.server._lock:
             self.server._clients[self.client_address[0]] = self.request
+        readinto = self.rfile.readinto
+        header_size = FRAME_HEADER.size
         while True:
+            header = self._header_view
             try:
-                buf = self.rfile.read(2)
-                if len(buf) == 0:
+                n = readinto(header)
+                if n != header_size and not (n and self._read_rest(header, n)):
                     break
             except OSError as ex:
                 # The client disconnected the connection
                 if ex.args[0] == ECONNRESET:
                     break
                 raise
-            (size,) = unpack("<H", buf)
-            buf = self.rfile.read(size)
-            msg_count, cmd_type, cmd, name_size = unpack("<HBBB", buf[0:5])
+            size, msg_count, cmd_type, cmd, name_size = FRAME_HEADER.unpack_from(header)
             if cmd_type != SYSTEM_COMMAND_NO_REPLY:
                 raise ValueError("Bad message type")
             if cmd != WRITEMAILBOX:
                 raise ValueError("Bad command")
-            mbox = buf[5 : 5 + name_size].decode().strip("\0")
-            (data_size,) = unpack("<H", buf[5 + name_size : 7 + name_size])
-            data = buf[7 + name_size : 7 + name_size + data_size]
-
-            with self.server._lock:
+            # size doesn't count itself.
+            frame_size = size + 2
+            if frame_size > len(self._buffer):
+                self._set_buffer(frame_size)
+            body = self._body_views.get(frame_size)
+            if body is None:
+                body = self._body_views[frame_size] = memoryview(self._buffer)[header_size:frame_size]
+            n = readinto(body)
+            if n != len(body) and not self._read_rest(body, n):
+                break
+
+            buf = self._buffer
+            names = self._names.get(name_size)
+            if names is not None and len(names) == 1 and buf.startswith(names[0][0], header_size):
+                mbox = names[0][1]
+            else:
+                mbox = self._decode_name(name_size)
+            (data_size,) = PAYLOAD_SIZE.unpack_from(buf, header_size + name_size)
+            # The buffer is reused for the next frame, so the payload has to be copied out.
+            # (Like slicing, this stops at the end of the frame.)
+            data_start = header_size + name_size + 2
+            data_stop = data_start + data_size
+            if data_stop > frame_size:
+                data_stop = frame_size
+            payload = self._payload_views.get(data_start)
+            if payload is None or len(payload) != data_stop - data_start:
+                payload = self._payload_views[data_start] = memoryview(buf)[data_start:data_stop]
+            data = payload.tobytes()
+
+            with self.server._update_cond:
                 self.server._mailboxes[mbox] = data
-                update_lock = self.server._updates.get(mbox)
-                if update_lock:
-                    update_lock.release()
+                self.server._seqs[mbox] = self.server._seqs.get(mbox, 0) + 1
+                self.server._update_cond.notify_all()
+
+
+class FrameEncoder:
+    """Encodes the frames for one mailbox and payload size.
+
+    Everything but the payload is the same for every frame, so the frame is
+    kept in a buffer and only the payload is written for each send. The
+    returned frame is only valid until the next call.
+    """
+
+    def __init__(self, mbox, payload_len):
+        mbox_len = len(mbox) + 1
+        header = pack(
+            "<HHBBB{}sH".format(mbox_len),
+            7 + mbox_len + payload_len,
+            1,
+            SYSTEM_COMMAND_NO_REPLY,
+            WRITEMAILBOX,
+            mbox_len,
+            mbox.encode("utf-8"),
+            payload_len,
+        )
+        self._offset = len(header)
+        self._buffer = bytearray(header) + bytearray(payload_len)
+        self._frame = memoryview(self._buffer)
+        self._payload = Struct("{}s".format(payload_len))
+
+    def encode(self, payload):
+        self._payload.pack_into(self._buffer, self._offset, payload)
+        return self._frame
+
+
+class _PendingFrames:
+    """Frames queued for one device."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.frames = 0
 
 
 class MailboxHandlerMixIn:
@@ -184,10 +339,26 @@ class MailboxHandlerMixIn:
         self._mailboxes = {}
         # map of device name/address to object with send() method
         self._clients = {}
-        # map of mailbox name to mutex lock
-        self._updates = {}
+        # map of mailbox name to the number of messages received, notified
+        # through _update_cond when it changes
+        self._seqs = {}
+        self._update_cond = Condition(self._lock)
         # map of names to addresses
         self._addresses = {}
+        # map of mailbox name to map of payload size to FrameEncoder
+        self._encoders = {}
+        # Batching, see set_batching(). Uses _lock.
+        self._flush_cond = Condition(self._lock)
+        self._flush_window = None
+        self._max_batch_size = 1000
+        self._corked = 0
+        # map of device address to the frames queued for it
+        self._pending = {}
+        self._flush_deadline = None
+        self._flusher = None
+        # number of socket writes, and of frames in them
+        self.writes = 0
+        self.frames_written = 0
 
     def read_from_mailbox(self, mbox):
         """Reads the current raw data from a mailbox.
@@ -204,6 +375,169 @@ class MailboxHandlerMixIn:
         with self._lock:
             return self._mailboxes.get(mbox)
 
+    def read_from_mailbox_with_seq(self, mbox):
+        """Reads the current raw data from a mailbox, and the number of
+        values it has received.
+
+        Arguments:
+            mbox (str):
+                The name of the mailbox.
+
+        Returns:
+            tuple:
+                The same as :meth:`read_from_mailbox`, and the number of
+                values received.
+        """
+        with self._lock:
+            return self._mailboxes.get(mbox), self._seqs.get(mbox, 0)
+
+    def mailbox_seq(self, mbox):
+        """The number of values ``mbox`` has received."""
+        with self._lock:
+            return self._seqs.get(mbox, 0)
+
+    def _encoder(self, mbox, payload_len):
+        # Call with _lock held.
+        encoders = self._encoders.get(mbox)
+        if encoders is None:
+            encoders = self._encoders[mbox] = {}
+        encoder = encoders.get(payload_len)
+        if encoder is None:
+            encoder = encoders[payload_len] = FrameEncoder(mbox, payload_len)
+        return encoder
+
+    def _address(self, brick):
+        # Call with _lock held.
+        addr = self._addresses.get(brick)
+        if addr is None:
+            addr = resolve(brick)
+            self._addresses[brick] = addr
+        if addr is None:
+            raise ValueError('no paired devices matching "{}"'.format(brick))
+        return addr
+
+    def _send(self, brick, data):
+        # Call with _lock held.
+        if self._flush_window is None and not self._corked:
+            if brick is None:
+                for client in self._clients.values():
+                    client.send(data)
+                    self.writes += 1
+                    self.frames_written += 1
+            else:
+                self._clients[self._address(brick)].send(data)
+                self.writes += 1
+                self.frames_written += 1
+            return
+
+        for addr in self._clients if brick is None else (self._address(brick),):
+            pending = self._pending.get(addr)
+            if pending is None:
+                pending = self._pending[addr] = _PendingFrames()
+            pending.data += data
+            pending.frames += 1
+            if len(pending.data) >= self._max_batch_size:
+                self._write_pending(addr, pending)
+        if self._flush_deadline is None and self._flush_window is not None and not self._corked:
+            self._flush_deadline = monotonic() + self._flush_window
+            self._flush_cond.notify()
+
+    def _write_pending(self, addr, pending):
+        # Call with _lock held.
+        if pending.frames:
+            client = self._clients.get(addr)
+            if client is not None:
+                client.sendall(pending.data)
+                self.writes += 1
+                self.frames_written += pending.frames
+            pending.data.clear()
+            pending.frames = 0
+
+    def _flush_locked(self):
+        for addr, pending in self._pending.items():
+            self._write_pending(addr, pending)
+        self._flush_deadline = None
+
+    def _flush_forever(self):
+        with self._flush_cond:
+            while self._flusher is not None:
+                if self._flush_deadline is None or self._corked:
+                    # uncork() writes whatever is queued.
+                    self._flush_deadline = None
+                    self._flush_cond.wait()
+                    continue
+                delay = self._flush_deadline - monotonic()
+                if delay > 0:
+                    self._flush_cond.wait(delay)
+                    continue
+                self._flush_locked()
+
+    def set_batching(self, flush_window=0.002, max_batch_size=1000):
+        """Queues outgoing frames, so that frames sent close together go out
+        in a single write.
+
+        Frames are written once the first of them has waited ``flush_window``
+        seconds, or as soon as the frames queued for a device add up to
+        ``max_batch_size`` bytes, whichever comes first. The frames are the
+        same as without batching.
+
+        Arguments:
+            flush_window (float):
+                The longest a frame waits for others, or ``None`` to turn
+                batching off again.
+            max_batch_size (int):
+                The most bytes to queue for a device before writing them.
+        """
+        with self._flush_cond:
+            self._flush_window = flush_window
+            self._max_batch_size = max_batch_size
+            if flush_window is None:
+                self._flusher = None
+                if not self._corked:
+                    self._flush_locked()
+            elif self._flusher is None:
+                self._flusher = Thread(target=self._flush_forever, name="mailbox flusher", daemon=True)
+                self._flusher.start()
+            self._flush_cond.notify()
+
+    def flush(self):
+        """Writes any queued frames now."""
+        with self._lock:
+            self._flush_locked()
+
+    def cork(self):
+        """Queues outgoing frames until :meth:`uncork`, e.g. to send the
+        updates of several mailboxes in a single write. Frames are still
+        written early if they add up to the ``max_batch_size`` of
+        :meth:`set_batching`. Calls can be nested.
+        """
+        with self._lock:
+            self._corked += 1
+
+    def uncork(self):
+        """Ends :meth:`cork`, writing the queued frames.
+
+        Raises:
+            RuntimeError: if there was no matching :meth:`cork`.
+        """
+        with self._flush_cond:
+            if not self._corked:
+                raise RuntimeError("uncork() without cork()")
+            self._corked -= 1
+            if not self._corked:
+                self._flush_locked()
+                self._flush_cond.notify()
+
+    def write_stats(self):
+        """The number of writes and of frames written so far, and the
+        average number of frames per write."""
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "frames": self.frames_written,
+                "frames_per_write": self.frames_written / self.writes if self.writes else 0.0,
+            }
+
     def send_to_mailbox(self, brick, mbox, payload):
         """Sends a mailbox value using raw bytes data.
 
@@ -216,45 +550,27 @@ class MailboxHandlerMixIn:
             payload (bytes):
                 A bytes-like object that will be sent to the mailbox.
         """
-        mbox_len = len(mbox) + 1
-        payload_len = len(payload)
-        send_len = 7 + mbox_len + payload_len
-        fmt = "<HHBBB{}sH{}s".format(mbox_len, payload_len)
-        data = pack(
-            fmt,
-            send_len,
-            1,
-            SYSTEM_COMMAND_NO_REPLY,
-            WRITEMAILBOX,
-            mbox_len,
-            mbox.encode("utf-8"),
-            payload_len,
-            payload,
-        )
         with self._lock:
-            if brick is None:
-                for client in self._clients.values():
-                    client.send(data)
-            else:
-                addr = self._addresses.get(brick)
-                if addr is None:
-                    addr = resolve(brick)
-                    self._addresses[brick] = addr
-                if addr is None:
-                    raise ValueError('no paired devices matching "{}"'.format(brick))
-                self._clients[addr].send(data)
-
-    def wait_for_mailbox_update(self, mbox):
-        """Waits until ``mbox`` receives a value."""
-        lock = Lock()
-        lock.acquire()
-        with self._lock:
-            self._updates[mbox] = lock
-        try:
-            return lock.acquire()
-        finally:
-            with self._lock:
-                del self._updates[mbox]
+            self._send(brick, self._encoder(mbox, len(payload)).encode(payload))
+
+    def wait_for_mailbox_update(self, mbox, timeout=None):
+        """Waits until ``mbox`` receives a value.
+
+        Returns:
+            bool: ``False`` if ``timeout`` seconds passed first.
+        """
+        with self._update_cond:
+            seq = self._seqs.get(mbox, 0)
+            return self._update_cond.wait_for(lambda: self._seqs.get(mbox, 0) != seq, timeout)
+
+    def wait_for_mailbox_seq(self, mbox, seq, timeout=None):
+        """Waits until ``mbox`` has received ``seq`` values in total.
+
+        Returns:
+            bool: ``False`` if ``timeout`` seconds passed first.
+        """
+        with self._update_cond:
+            return self._update_cond.wait_for(lambda: self._seqs.get(mbox, 0) >= seq, timeout)
 
 
 class BluetoothMailboxServer(MailboxHandlerMixIn, ThreadingRFCOMMServer):
@@ -294,6 +610,9 @@ class MailboxRFCOMMClient(ThreadingRFCOMMClient):
     def send(self, data):
         self.socket.send(data)
 
+    def sendall(self, data):
+        self.socket.sendall(data)
+
     def shutdown_request(self, request):
         request.close()
 
@@ -349,5 +668,81 @@ class BluetoothMailboxClient(MailboxHandlerMixIn):
     def close(self):
         """Closes the connections."""
         for client in self._clients.values():
-            client.client_close()
-        self._clients.clear()
\ No newline at end of file
+            # Once connected, MailboxHandler replaces the client object with its socket.
+            if hasattr(client, "client_close"):
+                client.client_close()
+            else:
+                client.close()
+        self._clients.clear()
+
+
+class TCPMailboxServer(MailboxHandlerMixIn, ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("localhost", 0)):
+        """Object that accepts mailbox connections over TCP instead of
+        Bluetooth, e.g. for a simulated EV3.
+
+        Arguments:
+            address (tuple):
+                The (host, port) to listen on. Port 0 picks a free port, see
+                ``server_address``.
+        """
+        super().__init__()
+        super(MailboxHandlerMixIn, self).__init__(address, MailboxHandler)
+
+    def wait_for_connection(self, count=1):
+        """Waits for a :class:`TCPMailboxClient` to connect.
+
+        Arguments:
+            count (int):
+                The number of remote connections to wait for.
+        """
+        for _ in range(count):
+            self.handle_request()
+
+
+class MailboxTCPClient(ThreadingTCPClient):
+    def __init__(self, parent, address):
+        self.parent = parent
+        super().__init__(address, MailboxHandler)
+
+    def send(self, data):
+        self.socket.sendall(data)
+
+    def sendall(self, data):
+        self.socket.sendall(data)
+
+    def shutdown_request(self, request):
+        request.close()
+
+    def finish_request(self, request, client_address):
+        self.RequestHandlerClass(request, client_address, self.parent)
+
+
+class TCPMailboxClient(BluetoothMailboxClient):
+    """Object that represents outgoing mailbox connections over TCP."""
+
+    def connect(self, address):
+        """Connects to a :class:`TCPMailboxServer`.
+
+        Arguments:
+            address (tuple):
+                The (host, port) of the server.
+
+        Raises:
+            ValueError:
+                A connection to ``address`` already exists.
+            OSError:
+                There was a problem establishing the connection.
+        """
+        client = MailboxTCPClient(self, address)
+        # Received messages are registered under the host, like MailboxHandler does.
+        if self._clients.setdefault(address[0], client) is not client:
+            raise ValueError("connection with this address already exists")
+        try:
+            client.handle_request()
+        except Exception:
+            del self._clients[address[0]]
+            raise
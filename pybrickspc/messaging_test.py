@@ -0,0 +1,301 @@
+#! /usr/bin/env python3
+
+import io
+import threading
+import time
+import unittest
+
+from pybrickspc.messaging import (
+    SYSTEM_COMMAND_NO_REPLY,
+    WRITEMAILBOX,
+    Mailbox,
+    MailboxHandler,
+    MailboxHandlerMixIn,
+    TCPMailboxClient,
+    TCPMailboxServer,
+)
+from struct import pack
+
+
+def encode_frame(mbox, payload):
+    """A frame as the EV3 firmware sends it."""
+    mbox_len = len(mbox) + 1
+    return pack(
+        "<HHBBB{}sH{}s".format(mbox_len, len(payload)),
+        7 + mbox_len + len(payload),
+        1,
+        SYSTEM_COMMAND_NO_REPLY,
+        WRITEMAILBOX,
+        mbox_len,
+        mbox.encode("utf-8"),
+        len(payload),
+        payload,
+    )
+
+
+class ChunkedReader(io.RawIOBase):
+    """Returns at most chunk bytes per read, like a socket can."""
+
+    def __init__(self, data, chunk):
+        self._data = memoryview(data)
+        self._chunk = chunk
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self._chunk, len(self._data))
+        b[:n] = self._data[:n]
+        self._data = self._data[n:]
+        return n
+
+
+class FakeRequest:
+    def __init__(self, reader):
+        self._reader = reader
+
+    def makefile(self, mode, bufsize=None):
+        return self._reader
+
+
+class Connection(MailboxHandlerMixIn):
+    def receive(self, reader):
+        MailboxHandler(FakeRequest(reader), ("test", 0), self)
+
+
+class TestMailboxHandler(unittest.TestCase):
+    def test_receive(self):
+        connection = Connection()
+        data = encode_frame("a", b"\x01\x02") + encode_frame("target", b"xyz") + encode_frame("a", b"\x03")
+        connection.receive(io.BufferedReader(io.BytesIO(data)))
+        self.assertEqual(connection.read_from_mailbox("a"), b"\x03")
+        self.assertEqual(connection.read_from_mailbox("target"), b"xyz")
+
+    def test_short_reads(self):
+        connection = Connection()
+        data = encode_frame("target", b"12345678") + encode_frame("other", b"abc")
+        connection.receive(ChunkedReader(data, 3))
+        self.assertEqual(connection.read_from_mailbox("target"), b"12345678")
+        self.assertEqual(connection.read_from_mailbox("other"), b"abc")
+
+    def test_names_of_same_size(self):
+        connection = Connection()
+        data = encode_frame("ab", b"1") + encode_frame("cd", b"2") + encode_frame("ab", b"3")
+        connection.receive(io.BufferedReader(io.BytesIO(data)))
+        self.assertEqual(connection.read_from_mailbox("ab"), b"3")
+        self.assertEqual(connection.read_from_mailbox("cd"), b"2")
+
+    def test_large_frame(self):
+        connection = Connection()
+        payload = bytes(range(256)) * 8
+        data = encode_frame("small", b"1") + encode_frame("big", payload) + encode_frame("small", b"2")
+        connection.receive(io.BufferedReader(io.BytesIO(data)))
+        self.assertEqual(connection.read_from_mailbox("big"), payload)
+        self.assertEqual(connection.read_from_mailbox("small"), b"2")
+
+    def test_payload_is_a_copy(self):
+        connection = Connection()
+        data = encode_frame("a", b"first") + encode_frame("b", b"other")
+        connection.receive(io.BufferedReader(io.BytesIO(data)))
+        self.assertIsInstance(connection.read_from_mailbox("a"), bytes)
+        self.assertEqual(connection.read_from_mailbox("a"), b"first")
+
+    def test_truncated_frame(self):
+        connection = Connection()
+        data = encode_frame("a", b"1") + encode_frame("a", b"2")[:-2]
+        connection.receive(io.BufferedReader(io.BytesIO(data)))
+        self.assertEqual(connection.read_from_mailbox("a"), b"1")
+
+    def test_bad_command(self):
+        connection = Connection()
+        data = bytearray(encode_frame("a", b"1"))
+        data[5] = 0x00
+        with self.assertRaises(ValueError):
+            connection.receive(io.BufferedReader(io.BytesIO(bytes(data))))
+
+
+class RecordingClient:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+
+    sendall = send
+
+
+class TestSendToMailbox(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.client = RecordingClient()
+        self.connection._clients["brick"] = self.client
+
+    def test_frames(self):
+        self.connection.send_to_mailbox(None, "target", b"\x01\x02")
+        self.connection.send_to_mailbox(None, "target", b"\x03\x04")
+        self.connection.send_to_mailbox("brick", "other", b"xyz")
+        self.connection.send_to_mailbox(None, "target", b"\x05")
+        self.assertEqual(
+            self.client.sent,
+            [
+                encode_frame("target", b"\x01\x02"),
+                encode_frame("target", b"\x03\x04"),
+                encode_frame("other", b"xyz"),
+                encode_frame("target", b"\x05"),
+            ],
+        )
+
+    def test_round_trip(self):
+        self.connection.send_to_mailbox(None, "target", b"payload")
+        self.connection.send_to_mailbox(None, "target", b"")
+        receiver = Connection()
+        receiver.receive(io.BufferedReader(io.BytesIO(b"".join(self.client.sent))))
+        self.assertEqual(receiver.read_from_mailbox("target"), b"")
+
+
+class TestBatching(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.client = RecordingClient()
+        self.connection._clients["brick"] = self.client
+
+    def tearDown(self):
+        self.connection.set_batching(None)
+
+    def test_cork(self):
+        self.connection.cork()
+        self.connection.send_to_mailbox(None, "a", b"1")
+        self.connection.cork()
+        self.connection.send_to_mailbox(None, "b", b"2")
+        self.connection.uncork()
+        self.assertEqual(self.client.sent, [])
+        self.connection.uncork()
+        self.assertEqual(self.client.sent, [encode_frame("a", b"1") + encode_frame("b", b"2")])
+        self.assertEqual(self.connection.write_stats(), {"writes": 1, "frames": 2, "frames_per_write": 2.0})
+
+    def test_unbalanced_uncork(self):
+        with self.assertRaises(RuntimeError):
+            self.connection.uncork()
+        # The failed call leaves nothing to balance.
+        self.connection.cork()
+        self.connection.send_to_mailbox(None, "a", b"1")
+        self.connection.uncork()
+        self.assertEqual(self.client.sent, [encode_frame("a", b"1")])
+
+    def test_flush_window(self):
+        self.connection.set_batching(flush_window=0.05)
+        self.connection.send_to_mailbox(None, "a", b"1")
+        self.connection.send_to_mailbox(None, "a", b"2")
+        self.assertEqual(self.client.sent, [])
+        deadline = time.monotonic() + 5
+        while not self.client.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.client.sent, [encode_frame("a", b"1") + encode_frame("a", b"2")])
+
+    def test_max_batch_size(self):
+        frame = encode_frame("a", b"1234")
+        self.connection.set_batching(flush_window=60, max_batch_size=2 * len(frame))
+        for _ in range(5):
+            self.connection.send_to_mailbox(None, "a", b"1234")
+        self.assertEqual(self.client.sent, [frame * 2, frame * 2])
+        self.connection.flush()
+        self.assertEqual(self.client.sent, [frame * 2, frame * 2, frame])
+        self.assertEqual(self.connection.write_stats()["frames_per_write"], 5 / 3)
+
+    def test_off(self):
+        self.connection.set_batching(flush_window=60)
+        self.connection.send_to_mailbox(None, "a", b"1")
+        self.connection.set_batching(None)
+        self.connection.send_to_mailbox(None, "a", b"2")
+        self.assertEqual(self.client.sent, [encode_frame("a", b"1"), encode_frame("a", b"2")])
+
+
+class TestUpdates(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.mailbox = Mailbox("a", self.connection)
+
+    def deliver(self, *payloads):
+        data = b"".join(encode_frame("a", p) for p in payloads)
+        self.connection.receive(io.BufferedReader(io.BytesIO(data)))
+
+    def start(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def test_seq(self):
+        self.assertEqual(self.mailbox.seq, 0)
+        self.assertEqual(self.mailbox.read_with_seq(), (None, 0))
+        self.deliver(b"1", b"2")
+        self.assertEqual(self.mailbox.seq, 2)
+        self.assertEqual(self.mailbox.read_with_seq(), (b"2", 2))
+
+    def test_timeout(self):
+        self.assertFalse(self.mailbox.wait(timeout=0.01))
+        self.assertFalse(self.mailbox.wait_for_seq(1, timeout=0.01))
+        self.assertIsNone(self.mailbox.wait_new(timeout=0.01))
+
+    def test_wait_for_seq_already_reached(self):
+        self.deliver(b"1")
+        self.assertTrue(self.mailbox.wait_for_seq(1, timeout=0))
+
+    def test_multiple_waiters(self):
+        results = []
+        waiting = threading.Barrier(4)
+
+        def waiter():
+            waiting.wait()
+            results.append(self.mailbox.wait(timeout=5))
+
+        threads = [self.start(waiter) for _ in range(3)]
+        waiting.wait()
+        # Give the waiters time to start waiting.
+        time.sleep(0.05)
+        self.deliver(b"1")
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True, True, True])
+
+    def test_wait_new_sees_repeated_value(self):
+        self.deliver(b"same")
+        results = []
+        started = threading.Event()
+
+        def waiter():
+            started.set()
+            results.append(self.mailbox.wait_new(timeout=5))
+
+        thread = self.start(waiter)
+        started.wait()
+        deadline = time.monotonic() + 5
+        while thread.is_alive() and time.monotonic() < deadline:
+            self.deliver(b"same")
+            time.sleep(0.01)
+        thread.join()
+        self.assertEqual(results, [b"same"])
+
+
+class TestTCP(unittest.TestCase):
+    def test_batched_loopback(self):
+        with TCPMailboxServer() as server:
+            client = TCPMailboxClient()
+            threading.Thread(target=server.wait_for_connection, daemon=True).start()
+            client.connect(server.server_address)
+            try:
+                client.cork()
+                for i in range(10):
+                    client.send_to_mailbox(None, "count", bytes([i]))
+                client.send_to_mailbox(None, "done", b"")
+                client.uncork()
+                deadline = time.monotonic() + 5
+                while server.read_from_mailbox("done") is None and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(server.read_from_mailbox("count"), bytes([9]))
+                self.assertEqual(client.write_stats()["writes"], 1)
+            finally:
+                client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+#! /usr/bin/env python3
+
+"""
+:class:`TCPClient` is the TCP counterpart of :class:`RFCOMMClient`, so that the
+EV3 mailbox protocol can be spoken over a local socket, e.g. to a simulated
+brick. (The server side is ``socketserver.TCPServer`` from the standard
+library.)
+"""
+
+from socket import socket, AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY
+from socketserver import ThreadingMixIn
+
+from pybrickspc.bluetooth import RFCOMMClient
+
+
+class TCPClient(RFCOMMClient):
+    def __init__(self, client_address, RequestHandlerClass):
+        self.client_address = client_address
+        self.RequestHandlerClass = RequestHandlerClass
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        # Mailbox messages are tiny, don't hold them back waiting for more.
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+
+class ThreadingTCPClient(ThreadingMixIn, TCPClient):
+    """
+    Version of :class:`TCPClient` that handles connections in a new thread.
+    """
+
+    daemon_threads = True
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+
+"""A precomputed index of the points the arm can reach.
+
+The box around the arm is divided into voxels, and a voxel is reachable if the closed
+form solution for its center is exact. For every voxel, the index stores the nearest
+reachable voxel (found with a Euclidean distance transform), which makes both
+reachability queries and projection onto the reachable region a table lookup.
+
+Like the IK grid, the index is cached on disk by geometry_cache, keyed by the geometry.
+"""
+
+import numpy as np
+import numpy.typing as npt
+from scipy.ndimage import distance_transform_edt
+
+import geometry_cache
+import kinematics
+
+Vec3 = kinematics.Vec3
+
+# Voxel edge length, in the same units as the link lengths.
+_DEFAULT_SPACING = 1.0
+
+# Projection refines the nearest reachable voxel center by bisecting toward the requested
+# point this many times.
+_PROJECTION_STEPS = 6
+
+
+def _is_exactly_reachable(xyz: Vec3) -> bool:
+    return bool(kinematics.get_motor_settings_analytic(xyz).success)
+
+
+class ReachabilityIndex:
+    def __init__(self, nearest: npt.NDArray[np.integer], origin: float, spacing: float):
+        """Wraps a nearest reachable voxel table.
+
+        Arguments:
+            nearest: An (n, n, n, 3) integer array. nearest[i, j, k] holds the index of
+                the reachable voxel closest to voxel (i, j, k), which is (i, j, k) itself
+                if that voxel is reachable.
+            origin: The coordinate of the center of voxel (0, 0, 0) along every axis.
+            spacing: The voxel edge length.
+        """
+        self.nearest = nearest
+        self.origin = origin
+        self.spacing = spacing
+        self._shape = np.array(nearest.shape[:3])
+
+    @classmethod
+    def build(cls, spacing: float = _DEFAULT_SPACING) -> "ReachabilityIndex":
+        """Computes a new index covering the arm's reach."""
+        points, origin = geometry_cache.workspace_grid(spacing)
+        _, errs = kinematics.get_motor_settings_analytic_batch(points)
+        reachable = errs < kinematics._ANALYTIC_TOLERANCE
+        # distance_transform_edt finds the nearest zero, so the reachable voxels must be zero.
+        _, nearest = distance_transform_edt(~reachable, return_indices=True)
+        return cls(np.moveaxis(nearest, 0, -1).astype(np.int16), origin, spacing)
+
+    @classmethod
+    def load_or_build(
+        cls, cache_dir: str | None = None, spacing: float = _DEFAULT_SPACING
+    ) -> "ReachabilityIndex":
+        """Memory maps the cached index for the current geometry, building and caching it
+        first if it does not exist yet."""
+        nearest = geometry_cache.load_or_build(
+            "reachability", spacing, lambda: cls.build(spacing).nearest, cache_dir
+        )
+        return cls(nearest, -kinematics.get_reach(), spacing)
+
+    def _voxel(self, xyz: Vec3) -> npt.NDArray[np.integer] | None:
+        """The voxel containing xyz, or None if xyz is outside the index."""
+        voxel = np.rint((np.asarray(xyz, dtype=np.float64) - self.origin) / self.spacing).astype(int)
+        if (voxel < 0).any() or (voxel >= self._shape).any():
+            return None
+        return voxel
+
+    def _center(self, voxel: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        return self.origin + self.spacing * np.asarray(voxel, dtype=np.float64)
+
+    def is_reachable(self, xyz: Vec3) -> bool:
+        """Whether the arm can reach xyz, to the resolution of the index."""
+        voxel = self._voxel(xyz)
+        if voxel is None:
+            return False
+        return bool((self.nearest[tuple(voxel)] == voxel).all())
+
+    def project(self, xyz: Vec3) -> npt.NDArray[np.float64]:
+        """The reachable point closest to xyz, or xyz itself if it is reachable."""
+        xyz = np.asarray(xyz, dtype=np.float64)
+        voxel = self._voxel(xyz)
+        if voxel is None:
+            voxel = np.clip(np.rint((xyz - self.origin) / self.spacing).astype(int), 0, self._shape - 1)
+        nearest = self.nearest[tuple(voxel)]
+        if (nearest == voxel).all() and _is_exactly_reachable(xyz):
+            return xyz
+
+        # The nearest voxel center is only accurate to the voxel size, so move out toward xyz
+        # for as long as the points stay reachable.
+        inside = self._center(nearest)
+        outside = xyz
+        for _ in range(_PROJECTION_STEPS):
+            mid = (inside + outside) / 2
+            if _is_exactly_reachable(mid):
+                inside = mid
+            else:
+                outside = mid
+        return inside
+
+
+_index: ReachabilityIndex | None = None
+
+
+def get_index() -> ReachabilityIndex:
+    """The process wide index, loaded from the cache on first use."""
+    global _index
+    if _index is None:
+        _index = ReachabilityIndex.load_or_build()
+    return _index
@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from math import radians
+import numpy as np
+import numpy.testing as npt
+
+import kinematics
+from reachability import ReachabilityIndex
+
+
+class TestReachabilityIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = ReachabilityIndex.build(spacing=2.0)
+
+    def test_reachable(self):
+        self.assertTrue(self.index.is_reachable(kinematics.get_pos((0, radians(45), radians(45)))))
+
+    def test_unreachable(self):
+        self.assertFalse(self.index.is_reachable((0.0, 0.0, 0.0)))
+        self.assertFalse(self.index.is_reachable((100.0, 0.0, 0.0)))
+
+    def test_project_reachable_is_unchanged(self):
+        target = kinematics.get_pos((0, radians(45), radians(45)))
+        npt.assert_array_equal(self.index.project(target), target)
+
+    def test_project_unreachable(self):
+        target = np.array((50.0, 0.0, 0.0))
+        projected = self.index.project(target)
+        self.assertTrue(kinematics.get_motor_settings_analytic(projected).success)
+        # The furthest the arm reaches along +X is 37, fully stretched.
+        self.assertLess(np.linalg.norm(projected - target), 13 + 2.0)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built = ReachabilityIndex.load_or_build(cache_dir, spacing=4.0)
+            loaded = ReachabilityIndex.load_or_build(cache_dir, spacing=4.0)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertIsInstance(loaded.nearest, np.memmap)
+            npt.assert_array_equal(built.nearest, loaded.nearest)
+
+
+if __name__ == "__main__":
+    unittest.main()
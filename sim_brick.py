@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+
+"""A simulated brick, for running the PC side without the arm.
+
+It speaks the same mailbox protocol as main.py, over TCP instead of Bluetooth: it answers
+arm_ranges, streams current_position at a fixed rate and applies target_position commands
+with the same clamping and speed logic as main.py's send_motor. The motors accelerate and
+decelerate at a fixed rate toward their targets.
+
+Run it, then point the client at it:
+
+    ./sim_brick.py --port 5000 &
+    EV3_SERVER=tcp:localhost:5000 ./control.py
+"""
+
+import argparse
+import math
+import struct
+import threading
+import time
+
+import net_formats
+from pybrickspc.messaging import Mailbox, TCPMailboxServer
+
+# Calibrated ranges, like the ones main.py finds: the turntable's lower stall varies,
+# arm1 is limited to 17-90 and arm2 stalls around 160.
+_DEFAULT_RANGES = ((-95, 90), (17, 90), (-6, 161))
+
+# Degrees/s^2 at the output of each joint.
+_DEFAULT_ACCELERATION = 720.0
+
+_PHYSICS_PERIOD_S = 0.005
+
+
+class SimMotor:
+    """A motor that runs to a target, ramping its speed up and down at a fixed acceleration."""
+
+    def __init__(self, angle: float = 0.0, acceleration: float = _DEFAULT_ACCELERATION):
+        self._angle = float(angle)
+        self._speed = 0.0
+        self._target: float | None = None
+        self._target_speed = 0.0
+        self.acceleration = acceleration
+
+    def angle(self) -> int:
+        return int(round(self._angle))
+
+    def run_target(self, speed: float, target: float):
+        self._target = float(target)
+        self._target_speed = abs(speed)
+
+    def step(self, dt: float):
+        if self._target is None:
+            return
+        remaining = self._target - self._angle
+        # The fastest we can go and still stop at the target.
+        stopping_speed = math.sqrt(2 * self.acceleration * abs(remaining))
+        desired = math.copysign(min(self._target_speed, stopping_speed), remaining)
+        max_change = self.acceleration * dt
+        self._speed += max(-max_change, min(max_change, desired - self._speed))
+        move = self._speed * dt
+        if abs(move) >= abs(remaining):
+            self._angle = self._target
+            self._speed = 0.0
+            self._target = None
+        else:
+            self._angle += move
+
+
+def send_motor(m: SimMotor, min_speed: int, range: tuple[int, int], target: int, time_ms: int):
+    """main.send_motor, for a SimMotor."""
+    actual_target = max(range[0], min(range[1], target))
+    ideal_speed = 1000 * float(abs(actual_target - m.angle())) / time_ms
+    actual_speed = max(ideal_speed, min_speed)
+    if m.angle() - actual_target == 0 or actual_speed < 0.05:
+        return
+    m.run_target(actual_speed, actual_target)
+
+
+class SimBrick:
+    def __init__(
+        self,
+        ranges: tuple[tuple[int, int], ...] = _DEFAULT_RANGES,
+        acceleration: float = _DEFAULT_ACCELERATION,
+    ):
+        self.ranges = ranges
+        # main.py leaves the turntable at 45, arm1 at 50 and arm2 at 10 after calibrating.
+        self.motors = [SimMotor(a, acceleration) for a in (45, 50, 10)]
+        self._lock = threading.Lock()
+
+    def positions(self) -> tuple[int, ...]:
+        with self._lock:
+            return tuple(m.angle() for m in self.motors)
+
+    def send_targets(self, time_ms: int, targets: tuple[int, ...]):
+        with self._lock:
+            # main.py's send_turntable/send_arm1/send_arm2 all use a minimum speed of 0.
+            for m, r, target in zip(self.motors, self.ranges, targets):
+                send_motor(m, 0, r, target, time_ms)
+
+    def step(self, dt: float):
+        with self._lock:
+            for m in self.motors:
+                m.step(dt)
+
+
+def serve(
+    server: TCPMailboxServer,
+    brick: SimBrick,
+    update_hz: float = 1000 / 33,
+    stop: threading.Event | None = None,
+):
+    """Serves one connection, like main.serve. Returns when stop is set."""
+    stop = stop if stop is not None else threading.Event()
+    server.wait_for_connection(1)
+
+    def physics():
+        last = time.monotonic()
+        while not stop.is_set():
+            time.sleep(_PHYSICS_PERIOD_S)
+            now = time.monotonic()
+            brick.step(now - last)
+            last = now
+
+    def update_positions():
+        position_mailbox = Mailbox(net_formats.current_channel, server)
+        while not stop.is_set():
+            position_mailbox.send(struct.pack(net_formats.current_format, *brick.positions()))
+            stop.wait(1 / update_hz)
+
+    def receive_position_commands():
+        mailbox = Mailbox(net_formats.target_channel, server)
+        handled = 0
+        while not stop.is_set():
+            # A command that arrived before we started waiting still counts.
+            if not mailbox.wait_for_seq(handled + 1, timeout=0.1):
+                continue
+            data, handled = mailbox.read_with_seq()
+            time_to_target, *targets = struct.unpack_from(net_formats.target_format, data)
+            brick.send_targets(time_to_target, tuple(targets))
+
+    def send_ranges():
+        range_mailbox = Mailbox(net_formats.range_channel, server)
+        # Over a local socket, the client's request can arrive before we start waiting.
+        range_mailbox.wait_for_seq(1)
+        range_mailbox.send(struct.pack(net_formats.range_format, *(a for r in brick.ranges for a in r)))
+
+    for target in (physics, update_positions, receive_position_commands):
+        threading.Thread(target=target, daemon=True).start()
+    send_ranges()
+    stop.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=1000 / 33, help="position updates per second")
+    args = parser.parse_args()
+
+    with TCPMailboxServer((args.host, args.port)) as server:
+        print("waiting for connection on", server.server_address)
+        serve(server, SimBrick(), args.rate)
+
+
+if __name__ == "__main__":
+    main()
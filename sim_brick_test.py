@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+
+import struct
+import threading
+import time
+import unittest
+
+import net_formats
+from pybrickspc.messaging import Mailbox, TCPMailboxClient, TCPMailboxServer
+from sim_brick import SimBrick, SimMotor, send_motor, serve
+
+
+class TestSimMotor(unittest.TestCase):
+    def test_reaches_target(self):
+        m = SimMotor(0)
+        send_motor(m, 0, (-10, 100), 50, 500)
+        for _ in range(1000):
+            m.step(0.005)
+        self.assertEqual(m.angle(), 50)
+
+    def test_clamps_to_range(self):
+        m = SimMotor(0)
+        send_motor(m, 0, (-10, 20), 50, 500)
+        for _ in range(1000):
+            m.step(0.005)
+        self.assertEqual(m.angle(), 20)
+
+    def test_speed_follows_time(self):
+        m = SimMotor(0, acceleration=1e6)
+        send_motor(m, 0, (-100, 100), 50, 1000)
+        for _ in range(100):
+            m.step(0.005)
+        # At 50 degrees/s, half a second gets us about halfway.
+        self.assertAlmostEqual(m.angle(), 25, delta=1)
+
+
+class TestSimBrickServer(unittest.TestCase):
+    def test_end_to_end(self):
+        server = TCPMailboxServer(("localhost", 0))
+        stop = threading.Event()
+        thread = threading.Thread(target=serve, args=(server, SimBrick()), kwargs={"update_hz": 100, "stop": stop})
+        thread.start()
+        try:
+            with TCPMailboxClient() as client:
+                client.connect(server.server_address)
+                ranges = Mailbox(net_formats.range_channel, client)
+                ranges.send(struct.pack("!h", 1))
+                while ranges.read() is None:
+                    time.sleep(0.01)
+                self.assertEqual(
+                    struct.unpack_from(net_formats.range_format, ranges.read()), (-95, 90, 17, 90, -6, 161)
+                )
+
+                target = Mailbox(net_formats.target_channel, client)
+                position = Mailbox(net_formats.current_channel, client)
+                deadline = time.monotonic() + 5
+                while time.monotonic() < deadline:
+                    target.send(struct.pack(net_formats.target_format, 100, 0, 30, 20))
+                    position.wait()
+                    if struct.unpack_from(net_formats.current_format, position.read()) == (0, 30, 20):
+                        break
+                else:
+                    self.fail("arm never reached its target")
+        finally:
+            stop.set()
+            thread.join()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+
+"""Estimates where the arm is now from delayed position telemetry.
+
+The brick sends its position every 33 ms, and it is a Bluetooth hop old by the time it arrives.
+JointStateEstimator runs a constant velocity Kalman filter per joint over the telemetry, so it
+can extrapolate the joint angles to the current time and estimate the joint velocities.
+"""
+
+import numpy as np
+import numpy.typing as npt
+
+
+class JointStateEstimator:
+    def __init__(
+        self,
+        acceleration_noise: float = 2000.0,
+        measurement_noise: float = 1.0,
+        latency_s: float = 0.02,
+    ):
+        """
+        Arguments:
+            acceleration_noise: The spectral density of the random acceleration of each joint,
+                in (degrees/s^2)^2/Hz. Higher values follow changes in speed more quickly but
+                smooth less.
+            measurement_noise: The variance of each measured angle, in degrees^2. The motors
+                report whole degrees.
+            latency_s: How old a position is when it arrives.
+        """
+        self.acceleration_noise = acceleration_noise
+        self.measurement_noise = measurement_noise
+        self.latency_s = latency_s
+        # Per joint state (angle, velocity) and its covariance.
+        self._x = np.zeros((3, 2))
+        self._p = np.zeros((3, 2, 2))
+        self._time: float | None = None
+
+    @property
+    def initialized(self) -> bool:
+        return self._time is not None
+
+    @property
+    def velocity(self) -> npt.NDArray[np.float64]:
+        """The estimated velocity of each joint, in degrees/s."""
+        return self._x[:, 1].copy()
+
+    def _propagate(self, dt: float):
+        f = np.array(((1.0, dt), (0.0, 1.0)))
+        q = self.acceleration_noise * np.array(((dt**3 / 3, dt**2 / 2), (dt**2 / 2, dt)))
+        self._x = self._x @ f.T
+        self._p = f @ self._p @ f.T + q
+
+    def update(self, angles: npt.ArrayLike, arrival_time: float):
+        """Adds a measurement of the joint angles that arrived at arrival_time (time.monotonic())."""
+        angles = np.asarray(angles, dtype=np.float64)
+        measured_at = arrival_time - self.latency_s
+        if self._time is None:
+            self._x[:, 0] = angles
+            self._x[:, 1] = 0
+            # We know nothing about the velocity yet.
+            self._p[:] = np.diag((self.measurement_noise, 1e4))
+            self._time = measured_at
+            return
+
+        self._propagate(max(0.0, measured_at - self._time))
+        self._time = max(self._time, measured_at)
+
+        # We only measure the angle, so the innovation is scalar per joint.
+        innovation = angles - self._x[:, 0]
+        s = self._p[:, 0, 0] + self.measurement_noise
+        gain = self._p[:, :, 0] / s[:, np.newaxis]
+        self._x += gain * innovation[:, np.newaxis]
+        self._p -= gain[:, :, np.newaxis] * self._p[:, np.newaxis, 0, :]
+
+    def predict(self, at_time: float) -> npt.NDArray[np.float64]:
+        """The estimated joint angles at at_time (time.monotonic())."""
+        if self._time is None:
+            raise ValueError("no measurements yet")
+        return self._x[:, 0] + self._x[:, 1] * (at_time - self._time)
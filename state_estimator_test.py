@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+
+from state_estimator import JointStateEstimator
+
+
+class TestJointStateEstimator(unittest.TestCase):
+    def test_stationary(self):
+        estimator = JointStateEstimator()
+        for i in range(10):
+            estimator.update((10, 20, 30), i * 0.033)
+        npt.assert_allclose(estimator.predict(1.0), (10, 20, 30), atol=1e-6)
+        npt.assert_allclose(estimator.velocity, (0, 0, 0), atol=1e-6)
+
+    def test_constant_velocity(self):
+        estimator = JointStateEstimator(latency_s=0.02)
+        velocity = np.array((30.0, -10.0, 5.0))
+        for i in range(60):
+            t = i * 0.033
+            # The measurement was taken latency_s before it arrived.
+            estimator.update(velocity * (t - 0.02), t)
+        npt.assert_allclose(estimator.velocity, velocity, atol=0.5)
+        # Extrapolating to the current time makes up for the latency.
+        npt.assert_allclose(estimator.predict(t), velocity * t, atol=0.1)
+
+    def test_noisy_measurements_are_smoothed(self):
+        rng = np.random.default_rng(0)
+        estimator = JointStateEstimator()
+        errors = []
+        for i in range(200):
+            t = i * 0.033
+            truth = np.full(3, 20.0 * t)
+            estimator.update(truth + rng.normal(0, 1, 3), t + 0.02)
+            if i > 50:
+                errors.append(estimator.predict(t + 0.02) - truth)
+        self.assertLess(np.std(errors), 1.0)
+
+    def test_predict_before_update(self):
+        with self.assertRaises(ValueError):
+            JointStateEstimator().predict(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
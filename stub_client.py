@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+
+"""An in-process stand-in for client, backed by a sim_brick.SimBrick.
+
+It has the same functions as client, but instead of talking to a brick it steps a simulated one
+up to the current time whenever it is asked for something. Positions are produced every 33 ms of
+clock time, like the brick's telemetry. With set_clock, the simulation follows any clock, e.g.
+a joystick_trace.ReplayClock, so a replay runs the same way no matter how fast it goes.
+"""
+
+import threading
+import time
+from typing import Callable, NamedTuple
+
+import sim_brick
+
+_TELEMETRY_PERIOD_S = 0.033
+
+
+class Position(NamedTuple):
+    angles: tuple[int, int, int]
+    """The raw angle of each motor."""
+
+    timestamp: float
+    """When the position was produced, by the stub's clock."""
+
+    seq: int
+    """Counts the positions produced so far, starting at 1."""
+
+
+_lock = threading.Lock()
+_clock: Callable[[], float] = time.monotonic
+_brick = sim_brick.SimBrick()
+_start = _clock()
+_sim_time = _start
+# Like the brick, which sends its position as soon as it is connected.
+_latest_position = Position(_brick.positions(), _start, 1)
+targets_sent = 0
+
+
+def set_clock(clock: Callable[[], float], brick: sim_brick.SimBrick | None = None):
+    """Restarts the simulation with a new clock, and optionally a new brick."""
+    global _clock, _brick, _start, _sim_time, _latest_position, targets_sent
+    with _lock:
+        _clock = clock
+        if brick is not None:
+            _brick = brick
+        _start = _sim_time = clock()
+        _latest_position = Position(_brick.positions(), _start, 1)
+        targets_sent = 0
+
+
+def _advance():
+    """Steps the brick to the current time, producing the positions due on the way."""
+    global _sim_time, _latest_position
+    now = _clock()
+    with _lock:
+        seq = _latest_position.seq
+        while True:
+            next_time = _start + seq * _TELEMETRY_PERIOD_S
+            if next_time > now:
+                break
+            _brick.step(next_time - _sim_time)
+            _sim_time = next_time
+            seq += 1
+            _latest_position = Position(_brick.positions(), next_time, seq)
+        _brick.step(now - _sim_time)
+        _sim_time = now
+
+
+def ranges():
+    return tuple(a for r in _brick.ranges for a in r)
+
+
+def latest_position() -> Position:
+    _advance()
+    return _latest_position
+
+
+def wait_newer_than(seq: int, timeout: float | None = None) -> Position | None:
+    """Like client.wait_newer_than. When the stub's clock is not time.monotonic, this can't
+    wait for time to pass, so it returns None unless the position is already there."""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        _advance()
+        if _latest_position.seq > seq:
+            return _latest_position
+        if _clock is not time.monotonic or (deadline is not None and time.monotonic() >= deadline):
+            return None
+        time.sleep(_TELEMETRY_PERIOD_S / 4)
+
+
+def current_position():
+    latest = latest_position()
+    # With a clock that isn't running, the next position may never come.
+    position = wait_newer_than(latest.seq) or latest_position()
+    return position.angles
+
+
+def set_target(ms_from_now: int, turntable_angle: int, arm1_angle: int, arm2_angle: int):
+    global targets_sent
+    _advance()
+    _brick.send_targets(ms_from_now, (turntable_angle, arm1_angle, arm2_angle))
+    targets_sent += 1
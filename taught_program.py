@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+
+"""Positions taught with the joystick, to be replayed later.
+
+Positions are stored as raw motor angles, which is what the brick reports and accepts. The
+program is saved as a small binary file: a header followed by three little endian 16 bit
+angles per position.
+"""
+
+import os
+import struct
+import numpy as np
+import numpy.typing as npt
+
+import atomic_write
+import trajectory
+
+_HEADER = struct.Struct("<4sBH")
+_MAGIC = b"EV3P"
+_VERSION = 1
+_POSITION = struct.Struct("<hhh")
+
+
+class TaughtProgram:
+    def __init__(self, positions: npt.ArrayLike = ()):
+        self.positions = np.asarray(positions, dtype=np.int16).reshape(-1, 3)
+        self._compiled: trajectory.Trajectory | None = None
+        # The compile() arguments that _compiled was computed for.
+        self._compiled_for: tuple | None = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, raw_angles: npt.ArrayLike):
+        self.positions = np.concatenate((self.positions, np.rint(raw_angles).astype(np.int16).reshape(1, 3)))
+        self._compiled = None
+
+    def clear(self):
+        self.positions = self.positions[:0]
+        self._compiled = None
+
+    def compile(self, ranges: npt.ArrayLike | None = None, rate_hz: float = 30.0) -> trajectory.Trajectory:
+        """The trajectory through all the positions. It is computed once and reused until the
+        program or the arguments change."""
+        key = (None if ranges is None else tuple(np.asarray(ranges, dtype=np.float64).ravel()), rate_hz)
+        if self._compiled is None or self._compiled_for != key:
+            self._compiled = trajectory.plan(self.positions, ranges, rate_hz=rate_hz)
+            self._compiled_for = key
+        return self._compiled
+
+    def save(self, path: str):
+        data = bytearray(_HEADER.size + _POSITION.size * len(self.positions))
+        _HEADER.pack_into(data, 0, _MAGIC, _VERSION, len(self.positions))
+        data[_HEADER.size :] = self.positions.astype("<i2").tobytes()
+        atomic_write.write_atomically(path, lambda f: f.write(data))
+
+    @classmethod
+    def load(cls, path: str) -> "TaughtProgram":
+        """Raises ValueError if path is not a taught program, or is truncated."""
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("{} is not a taught program".format(path))
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("{} is not a taught program".format(path))
+        if len(data) < _HEADER.size + _POSITION.size * count:
+            raise ValueError("{} is truncated".format(path))
+        positions = np.frombuffer(data, dtype="<i2", count=3 * count, offset=_HEADER.size)
+        return cls(positions.reshape(count, 3))
+
+    @classmethod
+    def load_or_empty(cls, path: str) -> "TaughtProgram":
+        """Loads the program at path. If there is none, or it can't be read, starts with an
+        empty program instead, which replaces the file on the next save."""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            return cls.load(path)
+        except (OSError, ValueError) as ex:
+            print("ignoring taught program: {}".format(ex))
+            return cls()
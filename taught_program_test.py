@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import numpy.testing as npt
+
+from taught_program import TaughtProgram
+
+
+class TestTaughtProgram(unittest.TestCase):
+    def test_save_and_load(self):
+        program = TaughtProgram()
+        program.add((10, 20, 30))
+        program.add((-90.4, 90, 161))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "program.bin")
+            program.save(path)
+            self.assertEqual(os.path.getsize(path), 7 + 2 * 6)
+            loaded = TaughtProgram.load(path)
+        npt.assert_array_equal(loaded.positions, ((10, 20, 30), (-90, 90, 161)))
+
+    def test_load_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "program.bin")
+            with open(path, "wb") as f:
+                f.write(b"not a program")
+            with self.assertRaises(ValueError):
+                TaughtProgram.load(path)
+
+    def test_load_or_empty(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "program.bin")
+            self.assertEqual(len(TaughtProgram.load_or_empty(path)), 0)
+            TaughtProgram([(1, 2, 3), (4, 5, 6)]).save(path)
+            self.assertEqual(len(TaughtProgram.load_or_empty(path)), 2)
+            # Cut off in the middle of the second position.
+            with open(path, "r+b") as f:
+                f.truncate(7 + 6 + 2)
+            with self.assertRaises(ValueError):
+                TaughtProgram.load(path)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(len(TaughtProgram.load_or_empty(path)), 0)
+            self.assertIn("truncated", out.getvalue())
+
+    def test_compile_is_cached_until_changed(self):
+        program = TaughtProgram([(0, 20, 0), (45, 50, 90)])
+        compiled = program.compile()
+        self.assertIs(program.compile(), compiled)
+        npt.assert_allclose(compiled.positions[-1], (45, 50, 90))
+        program.add((0, 20, 0))
+        self.assertIsNot(program.compile(), compiled)
+
+    def test_compile_follows_arguments(self):
+        program = TaughtProgram([(0, 20, 0), (45, 50, 90)])
+        compiled = program.compile()
+        self.assertIsNot(program.compile(rate_hz=10.0), compiled)
+        self.assertLess(len(program.compile(rate_hz=10.0)), len(compiled))
+        clamped = program.compile(ranges=(-90, 30, 17, 90, -6, 161))
+        npt.assert_allclose(clamped.positions[-1], (30, 50, 90))
+        self.assertIs(program.compile(ranges=[-90, 30, 17, 90, -6, 161]), clamped)
+        program.clear()
+        self.assertEqual(len(program), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
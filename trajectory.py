@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+"""Smooth joint space trajectories, streamed to the brick as a series of set_target commands.
+
+A single set_target jump makes the brick run each motor at a constant speed, which starts and
+stops abruptly. Instead, a trajectory follows a minimum jerk profile between configurations,
+precomputed at a fixed rate, and the streamer sends one short set_target per sample so that
+the brick only ever has to move a small step at a time.
+
+Everything here is in raw motor degrees, the units used by the brick for targets, ranges and
+speeds.
+"""
+
+import time
+from typing import Callable
+import numpy as np
+import numpy.typing as npt
+
+# Top speeds (degrees/s) for each joint, after the gearing. These are not measured. An EV3
+# large motor runs at roughly 1000 degrees/s unloaded (a medium motor faster). main.py gears
+# arm1 down 40:8 and arm2 down 36:8 then 36:12, so their outputs reach at least about 200 and
+# 74 degrees/s. The arm speeds are kept under that because the motors slow down under load.
+# main.py declares no gearing for the turntable, and its 180 is a cautious guess that keeps
+# the arm from swinging.
+MAX_SPEEDS = np.array((180.0, 120.0, 60.0))
+
+# Peak speed of a minimum jerk profile, relative to its average speed.
+_MIN_JERK_PEAK = 1.875
+
+_DEFAULT_RATE_HZ = 30.0
+
+
+class Trajectory:
+    def __init__(self, times: npt.NDArray[np.float64], positions: npt.NDArray[np.float64]):
+        """
+        Arguments:
+            times: N increasing sample times in seconds, starting at 0.
+            positions: An (N, 3) array with the raw motor angles at each sample time.
+        """
+        self.times = times
+        self.positions = positions
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1])
+
+    def __len__(self):
+        return len(self.times)
+
+
+def motion_time(
+    start: npt.ArrayLike,
+    end: npt.ArrayLike,
+    min_duration: float = 0.0,
+    max_speeds: npt.ArrayLike = MAX_SPEEDS,
+) -> float:
+    """The duration of a minimum jerk motion from start to end.
+
+    This is the shortest duration that keeps every joint's peak speed under max_speeds, but at
+    least min_duration. Not moving at all takes no time.
+    """
+    delta = np.abs(np.asarray(end, dtype=np.float64) - np.asarray(start, dtype=np.float64))
+    if not delta.any():
+        return 0.0
+    return max(float(np.max(_MIN_JERK_PEAK * delta / max_speeds)), min_duration)
+
+
+def min_jerk(
+    start: npt.ArrayLike, end: npt.ArrayLike, duration: float, rate_hz: float = _DEFAULT_RATE_HZ
+) -> Trajectory:
+    """Samples a minimum jerk motion from start to end that takes duration seconds."""
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    steps = max(1, int(np.ceil(duration * rate_hz)))
+    s = np.linspace(0.0, 1.0, steps + 1)
+    profile = s**3 * (10 - 15 * s + 6 * s**2)
+    return Trajectory(s * duration, start + profile[:, np.newaxis] * (end - start))
+
+
+def plan(
+    waypoints: npt.ArrayLike,
+    ranges: npt.ArrayLike | None = None,
+    rate_hz: float = _DEFAULT_RATE_HZ,
+    min_duration: float = 0.0,
+    max_speeds: npt.ArrayLike = MAX_SPEEDS,
+) -> Trajectory:
+    """Plans a trajectory that stops at each of an (N, 3) array of waypoints.
+
+    Each leg is a minimum jerk motion taking motion_time. If ranges (as returned by
+    client.ranges()) are given, the waypoints are first clamped to them, like the brick would.
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64).reshape(-1, 3)
+    if ranges is not None:
+        limits = np.asarray(ranges, dtype=np.float64).reshape(3, 2)
+        waypoints = np.clip(waypoints, limits[:, 0], limits[:, 1])
+
+    times = [np.zeros(1)]
+    positions = [waypoints[:1]]
+    elapsed = 0.0
+    for start, end in zip(waypoints[:-1], waypoints[1:]):
+        duration = motion_time(start, end, min_duration, max_speeds)
+        if duration == 0:
+            continue
+        leg = min_jerk(start, end, duration, rate_hz)
+        times.append(elapsed + leg.times[1:])
+        positions.append(leg.positions[1:])
+        elapsed += duration
+    return Trajectory(np.concatenate(times), np.concatenate(positions))
+
+
+def stream(
+    trajectory: Trajectory,
+    send: Callable[[int, int, int, int], None],
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> int:
+    """Sends trajectory as timed set_target commands through send, which takes the same
+    arguments as client.set_target.
+
+    Each command is sent when the previous sample is due, asking the brick to reach the next
+    sample by the time it is due. Commands that would not change the target are skipped, but the
+    final target is always sent. Returns the number of commands sent.
+    """
+    targets = np.rint(trajectory.positions).astype(int).tolist()
+    start = clock()
+    sent = 0
+    last = tuple(targets[0])
+    for i in range(1, len(trajectory)):
+        target = tuple(targets[i])
+        if target == last and i != len(trajectory) - 1:
+            continue
+        delay = start + trajectory.times[i - 1] - clock()
+        if delay > 0:
+            sleep(delay)
+        in_ms = max(1, int(round(1000 * (trajectory.times[i] - trajectory.times[i - 1]))))
+        send(in_ms, *target)
+        last = target
+        sent += 1
+    return sent
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+
+import trajectory
+from trajectory import MAX_SPEEDS, min_jerk, motion_time, plan, stream
+
+
+class TestMinJerk(unittest.TestCase):
+    def test_endpoints_and_shape(self):
+        traj = min_jerk((0, 0, 0), (90, 30, -60), 1.0, rate_hz=50)
+        self.assertEqual(traj.positions.shape, (51, 3))
+        npt.assert_allclose(traj.positions[0], (0, 0, 0))
+        npt.assert_allclose(traj.positions[-1], (90, 30, -60))
+        npt.assert_allclose(traj.positions[25], (45, 15, -30))
+        self.assertAlmostEqual(traj.duration, 1.0)
+
+    def test_starts_and_stops_smoothly(self):
+        traj = min_jerk((0, 0, 0), (90, 0, 0), 1.0, rate_hz=100)
+        steps = np.diff(traj.positions[:, 0])
+        self.assertLess(steps[0], steps[50] / 100)
+        self.assertLess(steps[-1], steps[50] / 100)
+
+
+class TestMotionTime(unittest.TestCase):
+    def test_peak_speed_within_limits(self):
+        start, end = np.zeros(3), np.array((100.0, 100.0, 100.0))
+        duration = motion_time(start, end)
+        traj = min_jerk(start, end, duration, rate_hz=1000)
+        speeds = np.abs(np.diff(traj.positions, axis=0)) / np.diff(traj.times)[:, np.newaxis]
+        self.assertTrue((speeds.max(axis=0) <= MAX_SPEEDS * 1.001).all())
+        # The slowest joint should be going as fast as it can.
+        self.assertAlmostEqual(speeds.max(axis=0)[2], MAX_SPEEDS[2], delta=1)
+
+    def test_min_duration(self):
+        # main.py runs the motors with no minimum speed, so even a short motion can be slow.
+        self.assertAlmostEqual(motion_time((0, 0, 0), (15, 0, 0), min_duration=10), 10.0)
+        self.assertAlmostEqual(motion_time((0, 0, 0), (15, 0, 0), min_duration=0.01), 15 * 1.875 / 180)
+        self.assertEqual(motion_time((1, 2, 3), (1, 2, 3), min_duration=10), 0.0)
+
+
+class TestPlan(unittest.TestCase):
+    def test_clamps_and_stops_at_waypoints(self):
+        ranges = (-90, 90, 17, 90, -6, 161)
+        traj = plan([(0, 20, 0), (200, 50, 100), (0, 20, 0)], ranges)
+        npt.assert_allclose(traj.positions[0], (0, 20, 0))
+        npt.assert_allclose(traj.positions[-1], (0, 20, 0))
+        self.assertAlmostEqual(traj.positions[:, 0].max(), 90)
+        self.assertTrue((np.diff(traj.times) > 0).all())
+
+
+class TestStream(unittest.TestCase):
+    def test_stream(self):
+        now = [0.0]
+
+        def sleep(s):
+            now[0] += s
+
+        sent = []
+        traj = min_jerk((0, 0, 0), (10, 0, 0), 1.0, rate_hz=10)
+        count = stream(traj, lambda *args: sent.append((now[0], args)), sleep=sleep, clock=lambda: now[0])
+        self.assertEqual(count, len(sent))
+        self.assertEqual(sent[-1][1], (100, 10, 0, 0))
+        # The first and last steps are too small to move the target and are skipped.
+        self.assertLess(count, 10)
+        for (t, (in_ms, *_)) in sent:
+            self.assertEqual(in_ms, 100)
+        self.assertEqual([t for t, _ in sent], sorted(t for t, _ in sent))
+
+
+if __name__ == "__main__":
+    unittest.main()